@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from src.misc.bench_fns import (
+    SyntheticEmbedder,
+    get_peak_rss_mb,
+    make_synthetic_pdf,
+    make_synthetic_text,
+    summarize_timings,
+    time_stage,
+)
+from src.instrumentation import StageTimer
+from src.misc.string_fns import StringCleaner, clean_string
+from src.pdf_search import PDFSearch
+from src.vector_db import VectorDB
+
+
+def bench_cleaner(sentence_list: list, char_replace_dict: dict) -> dict:
+    def clean_per_word(sentence_raw: str):
+        word_list = [
+            s.lower().strip() for s in sentence_raw.split(" ") if len(s.strip()) > 0
+        ]
+        return " ".join([clean_string(s, char_replace_dict) for s in word_list])
+
+    string_cleaner = StringCleaner(char_replace_dict)
+    bench_dict = {
+        "clean_string": time_stage(
+            lambda: len([clean_per_word(x) for x in sentence_list])
+        ),
+        "string_cleaner": time_stage(
+            lambda: len([string_cleaner.clean_sentence(x) for x in sentence_list])
+        ),
+    }
+    bench_dict["speedup"] = (
+        bench_dict["clean_string"]["seconds"] / bench_dict["string_cleaner"]["seconds"]
+    )
+    return bench_dict
+
+
+def bench_embedder_agreement(
+    reference_embedder,
+    embedder,
+    n_sentences: int = 2000,
+    n_queries: int = 100,
+    k: int = 10,
+    seed: int = 0,
+) -> dict:
+    """
+    Compare an embedder against a reference on the same synthetic corpus
+    :param reference_embedder: embedder treated as ground truth
+    :param embedder: embedder to compare
+    :param n_sentences: corpus size
+    :param n_queries: queries drawn from the corpus
+    :param k: neighbors compared per query
+    :param seed: random seed
+    :return: dict of mean cosine similarity, recall@k and speed ratios
+    """
+    rng = np.random.default_rng(seed)
+    sentence_list = make_synthetic_text(n_sentences, rng)
+    query_list = [
+        sentence_list[i] for i in rng.choice(n_sentences, n_queries, replace=False)
+    ]
+    neighbor_list, embedding_list, seconds_list = [], [], []
+    for curr_embedder in [reference_embedder, embedder]:
+        time_start = time.perf_counter()
+        embedding_arr = np.asarray(
+            curr_embedder.encode(sentence_list, is_query=False), dtype=np.float32
+        )
+        seconds_list.append(time.perf_counter() - time_start)
+        query_arr = np.asarray(curr_embedder.encode(query_list), dtype=np.float32)
+        vector_db = VectorDB(embedding_arr.shape[1])
+        vector_db.add_vectors(embedding_arr)
+        neighbor_list.append(vector_db._search(query_arr, k)[1])
+        embedding_list.append(embedding_arr)
+    cosine_arr = np.sum(embedding_list[0] * embedding_list[1], axis=1) / (
+        np.linalg.norm(embedding_list[0], axis=1)
+        * np.linalg.norm(embedding_list[1], axis=1)
+    )
+    n_match = sum(
+        len(np.intersect1d(neighbor_list[0][i], neighbor_list[1][i]))
+        for i in range(n_queries)
+    )
+    return {
+        "mean_cosine": float(np.mean(cosine_arr)),
+        "min_cosine": float(np.min(cosine_arr)),
+        "recall_at_k": n_match / float(neighbor_list[0].size),
+        "embed_speedup": seconds_list[0] / seconds_list[1],
+    }
+
+
+def bench_pdf_search(
+    pdf_filepath: str,
+    char_replace_filepath: str,
+    embedder,
+    k: int = 10,
+    n_queries: int = 200,
+    n_workers: int = 1,
+    seed: int = 0,
+) -> dict:
+    stage_timer = StageTimer()
+    pdf_search = PDFSearch(
+        pdf_filepath=pdf_filepath,
+        char_config_filepath=char_replace_filepath,
+        embedder=embedder,
+        load_from_cache=False,
+        save_to_cache=False,
+        verbose=False,
+        n_workers=n_workers,
+        query_cache_size=0,
+        instrumentation=stage_timer,
+    )
+    pdf_search._read_char_config()
+    pdf_search._create_vector_db()
+    char_replace_dict = pdf_search._char_config["replace"]
+
+    def read_pdf():
+        pdf_search._read_pdf(verbose=False)
+        return len(pdf_search.get_pdf())
+
+    def clean_and_label():
+        pdf_search._clean_and_label_sentences(char_replace_dict)
+        return len(pdf_search._embedded_dict)
+
+    def embed_strings():
+        pdf_search._embed_strings(verbose=False)
+        return len(pdf_search._embedded_dict)
+
+    def load_vector_db():
+        pdf_search._load_vector_db()
+        return pdf_search.get_vector_db().get_n_vectors()
+
+    stage_dict = {
+        "read_pdf": time_stage(read_pdf),
+        "clean_and_label_sentences": time_stage(clean_and_label),
+        "embed_strings": time_stage(embed_strings),
+        "load_vector_db": time_stage(load_vector_db),
+    }
+    stage_dict["embed_strings"].update(pdf_search.get_embed_stats())
+
+    embedding_arr = np.asarray(pdf_search._embedding_arr)
+    vector_db = VectorDB(embedding_arr.shape[1])
+    stage_dict["vector_db_add_vectors"] = time_stage(
+        lambda: vector_db.add_vectors(embedding_arr) or len(embedding_arr)
+    )
+
+    rng = np.random.default_rng(seed)
+    sentence_list = [x["sentence_raw"] for x in pdf_search._embedded_dict.values()]
+    query_list = [
+        sentence_list[i] for i in rng.integers(0, len(sentence_list), n_queries)
+    ]
+    # query caching is disabled so every search is embedded and run #
+    for mode in ["vector", "lexical", "hybrid"]:
+        seconds_list = []
+        for query in query_list:
+            time_start = time.perf_counter()
+            pdf_search.search(query, k=k, mode=mode)
+            seconds_list.append(time.perf_counter() - time_start)
+        stage_name = "search" if mode == "vector" else f"search_{mode}"
+        stage_dict[stage_name] = summarize_timings(seconds_list)
+    # first half of the pages, compared against the unfiltered "search" entry #
+    page_range = (0, max(0, len(pdf_search.get_pdf()) // 2 - 1))
+    seconds_list = []
+    for query in query_list:
+        time_start = time.perf_counter()
+        pdf_search.search(query, k=k, page_range=page_range)
+        seconds_list.append(time.perf_counter() - time_start)
+    stage_dict["search_page_range"] = summarize_timings(seconds_list)
+    stage_dict["search_many"] = time_stage(
+        lambda: len(pdf_search.search_many(query_list, k=k))
+    )
+    stage_dict["cleaner"] = bench_cleaner(sentence_list, char_replace_dict)
+    stage_dict["instrumentation"] = stage_timer.get_stats()
+    return stage_dict
+
+
+def bench_train_loaders(
+    tokenizer_name: str,
+    n_samples: int = 20000,
+    batch_size: int = 32,
+    n_classes: int = 10,
+    seed: int = 0,
+) -> dict:
+    from transformers import AutoTokenizer
+    from src.misc.train_fns import data_feeder_batch, data_loader
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    rng = np.random.default_rng(seed)
+    x_data = np.asarray(make_synthetic_text(n_samples, rng))
+    y_data = rng.integers(0, n_classes, n_samples).astype(str)
+
+    def consume(batch_iter):
+        for _ in batch_iter:
+            pass
+        return n_samples
+
+    bench_dict = {
+        "data_feeder_batch": time_stage(
+            lambda: consume(
+                data_feeder_batch(tokenizer, x_data, y_data, batch_size, device="cpu")
+            )
+        )
+    }
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_filepath = os.path.join(temp_dir, "tokens.npz")
+        # first epoch tokenizes and writes the store, later epochs only read it #
+        for epoch_name in ["data_loader_first_epoch", "data_loader_cached"]:
+            bench_dict[epoch_name] = time_stage(
+                lambda: consume(
+                    data_loader(
+                        tokenizer,
+                        x_data,
+                        y_data,
+                        batch_size,
+                        device="cpu",
+                        cache_filepath=cache_filepath,
+                        seed=seed,
+                    )
+                )
+            )
+    for loader_name in ["data_loader_first_epoch", "data_loader_cached"]:
+        bench_dict[loader_name]["speedup"] = (
+            bench_dict[loader_name]["items_per_sec"]
+            / bench_dict["data_feeder_batch"]["items_per_sec"]
+        )
+    return bench_dict
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the PDFSearch lifecycle")
+    parser.add_argument("--pdf-filepath", default=None)
+    parser.add_argument("--char-replace-filepath", default="ref/char_replace.yml")
+    parser.add_argument("--n-pages", type=int, default=50)
+    parser.add_argument("--n-sentences-per-page", type=int, default=30)
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--n-workers", type=int, default=1)
+    parser.add_argument("--n-dims", type=int, default=768)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--n-threads", type=int, default=None)
+    parser.add_argument("--tokenizer", default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    embedder_dict = {"synthetic": SyntheticEmbedder(n_dims=args.n_dims)}
+    if args.real_embedder:
+        try:
+            from src.sgpt_embedder import SGPTEmbedder
+
+            embedder_dict["sgpt"] = SGPTEmbedder()
+            embedder_dict["sgpt_cpu"] = SGPTEmbedder(
+                cpu_mode=True, n_threads=args.n_threads
+            )
+        except (ImportError, OSError) as load_error:
+            print(f"SKIPPING SGPT EMBEDDER: {load_error}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_filepath = args.pdf_filepath
+        if pdf_filepath is None:
+            pdf_filepath = os.path.join(temp_dir, "synthetic.pdf")
+            make_synthetic_pdf(
+                pdf_filepath,
+                n_pages=args.n_pages,
+                n_sentences_per_page=args.n_sentences_per_page,
+            )
+        results_dict = {
+            "config": vars(args),
+            "embedders": {
+                embedder_name: bench_pdf_search(
+                    pdf_filepath,
+                    args.char_replace_filepath,
+                    embedder,
+                    k=args.k,
+                    n_queries=args.n_queries,
+                    n_workers=args.n_workers,
+                )
+                for embedder_name, embedder in embedder_dict.items()
+            },
+        }
+    if "sgpt_cpu" in embedder_dict:
+        # latency and throughput deltas are the sgpt vs sgpt_cpu stage entries #
+        results_dict["sgpt_cpu_agreement"] = bench_embedder_agreement(
+            embedder_dict["sgpt"], embedder_dict["sgpt_cpu"], k=args.k
+        )
+    if args.tokenizer is not None:
+        results_dict["train_loaders"] = bench_train_loaders(args.tokenizer)
+    results_dict["peak_rss_mb"] = get_peak_rss_mb()
+
+    results_json = json.dumps(results_dict, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as file_writer:
+            file_writer.write(results_json)
+    print(results_json)
@@ -1,5 +1,5 @@
 from src.display_window import DisplayWindow
-from src.sgpt_embedder import SGPTEmbedder
+from src.lazy_embedder import LazyEmbedder
 from src.pdf_search import PDFSearch
 
 
@@ -11,8 +11,9 @@ if __name__ == "__main__":
     pdf_filepath = "data/astronomy_openstax.pdf"
     char_replace_filepath = "ref/char_replace.yml"
 
-    embedder = SGPTEmbedder()
-    embedding_dims = embedder.get_sentence_embedding_dimension()
+    # model loads in the background while the cache and window come up #
+    embedder = LazyEmbedder()
+    embedder.preload()
 
     pdf_search_args = {
         "pdf_filepath": pdf_filepath,
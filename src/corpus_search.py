@@ -0,0 +1,146 @@
+import hashlib
+import heapq
+import os
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from src.instrumentation import NullInstrumentation
+from src.pdf_search import PDFSearch
+
+
+class CorpusSearch:
+    def __init__(
+        self,
+        char_config_filepath: str,
+        embedder,
+        cache_dir: str = "cache",
+        instrumentation=None,
+        n_search_workers: int = 4,
+        verbose: bool = True,
+        **kwargs,
+    ):
+        self._cache_dir = cache_dir
+        self._char_config_filepath = char_config_filepath
+        self._embedder = embedder
+        self._instrumentation = (
+            NullInstrumentation() if instrumentation is None else instrumentation
+        )
+        self._n_search_workers = n_search_workers
+        self._verbose = verbose
+        self._kwargs = kwargs
+
+        # one shard (PDFSearch with its own VectorDB) per document #
+        self._shard_dict = OrderedDict()
+        self._filepath_dict = {}
+        self._executor = ThreadPoolExecutor(max_workers=n_search_workers)
+
+    def _merge_results(self, shard_result_list: List[tuple], k: int) -> List[dict]:
+        candidate_list = []
+        for document_name, result_dict in shard_result_list:
+            for i in range(len(result_dict["ids"])):
+                candidate_list.append(
+                    (float(result_dict["distances"][i]), document_name, i, result_dict)
+                )
+        merged_list = []
+        for distance, document_name, i, result_dict in heapq.nsmallest(
+            k, candidate_list, key=lambda x: x[0]
+        ):
+            vector_info = {
+                "document": document_name,
+                "id": result_dict["ids"][i],
+                "distance": distance,
+            }
+            if "metadata" in result_dict:
+                vector_info["metadata"] = result_dict["metadata"][i]
+            merged_list.append(vector_info)
+        return merged_list
+
+    def _search_shards(
+        self, vectors: np.ndarray, k: int, return_metadata: bool
+    ) -> List[List[tuple]]:
+        # faiss releases the GIL while searching, so shards run in parallel #
+        shard_list = list(self._shard_dict.items())
+        future_list = [
+            self._executor.submit(
+                pdf_search.get_vector_db().get_neighbors_batch,
+                vectors=vectors,
+                k=k,
+                return_metadata=return_metadata,
+            )
+            for _, pdf_search in shard_list
+        ]
+        shard_result_list = [future.result() for future in future_list]
+        return [
+            [
+                (shard_list[i][0], shard_result_list[i][idx_query])
+                for i in range(len(shard_list))
+            ]
+            for idx_query in range(len(vectors))
+        ]
+
+    def add_document(
+        self, pdf_filepath: str, document_name: str = None, **kwargs
+    ) -> str:
+        """
+        Load or build the shard for a pdf, other shards are left untouched
+        :param pdf_filepath: pdf to index
+        :param document_name: name used in results and for the shard's cache
+            directory, defaults to the file name, with a hash of the path
+            appended when another file of that name is already in the corpus
+        :param kwargs: PDFSearch arguments overriding the corpus defaults
+        :return: document name
+        """
+        abs_filepath = os.path.abspath(pdf_filepath)
+        if document_name is None:
+            document_name = os.path.splitext(os.path.basename(pdf_filepath))[0]
+            if self._filepath_dict.get(document_name, abs_filepath) != abs_filepath:
+                # derived from the path so the name, and its cache, survive restarts #
+                path_hash = hashlib.sha1(abs_filepath.encode("utf-8")).hexdigest()
+                document_name = f"{document_name}_{path_hash[:8]}"
+        # re-adding the same file reloads its shard, another file may not take it #
+        assert (
+            self._filepath_dict.get(document_name, abs_filepath) == abs_filepath
+        ), f"DOCUMENT NAME {document_name} IS ALREADY USED BY ANOTHER FILE"
+        pdf_search_args = {
+            "pdf_filepath": pdf_filepath,
+            "char_config_filepath": self._char_config_filepath,
+            "cache_dir": os.path.join(self._cache_dir, document_name),
+            "embedder": self._embedder,
+            "instrumentation": self._instrumentation,
+            "verbose": self._verbose,
+        }
+        pdf_search_args.update(self._kwargs)
+        pdf_search_args.update(kwargs)
+        pdf_search = PDFSearch(**pdf_search_args)
+        pdf_search.config()
+        self._shard_dict[document_name] = pdf_search
+        self._filepath_dict[document_name] = abs_filepath
+        return document_name
+
+    def get_document(self, document_name: str) -> PDFSearch:
+        return self._shard_dict[document_name]
+
+    def get_document_names(self) -> List[str]:
+        return list(self._shard_dict.keys())
+
+    def remove_document(self, document_name: str):
+        self._shard_dict.pop(document_name)
+        self._filepath_dict.pop(document_name)
+
+    def search(self, string: str, k: int = 10, return_metadata: bool = True):
+        return self.search_many([string], k=k, return_metadata=return_metadata)[0]
+
+    def search_many(
+        self, strings: List[str], k: int = 10, return_metadata: bool = True
+    ) -> List[List[dict]]:
+        assert len(self._shard_dict) > 0, "CORPUS MUST CONTAIN DOCUMENTS"
+        with self._instrumentation.stage("query_encode", n_items=len(strings)):
+            embedded_arr = self._embedder.encode(list(strings), show_progress_bar=False)
+        query_result_list = self._search_shards(
+            embedded_arr, k=k, return_metadata=return_metadata
+        )
+        return [
+            self._merge_results(shard_result_list, k=k)
+            for shard_result_list in query_result_list
+        ]
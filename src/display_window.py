@@ -1,6 +1,8 @@
+import queue
 import tkinter as tk
-from pdf_search import PDFSearch
+from src.pdf_search import PDFSearch
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 
 class DisplayWindow(tk.Tk):
@@ -12,9 +14,21 @@ class DisplayWindow(tk.Tk):
         self._color_args = {"foreground": "white", "background": "black"}
         self._current_page = 0
         self._n_current_result = -1
+        self._poll_ms = 50
+        self._rendered_page = None
+        self._search_future = None
+        self._search_generation = 0
+        self._search_queue = queue.Queue()
         self._search_results = None
+        self._all_sections_str = "All sections"
+        # tk 8.6 counts a character outside the bmp as two, tk 9 as one #
+        self._astral_width = int(self.tk.call("string", "length", "\U0001d465"))
+        # one worker so searches run in order and never on the tk thread #
+        self._search_executor = ThreadPoolExecutor(max_workers=1)
         self._pdf_crawler = pdf_crawler
         self._pdf_content_dict = pdf_crawler.get_pdf()
+        # the outline is read when the section menu is first opened #
+        self._section_list = None
         self._frame_dict = OrderedDict()
         self._button_dict = OrderedDict()
         self._search_dict = OrderedDict()
@@ -66,12 +80,30 @@ class DisplayWindow(tk.Tk):
         self._search_dict["forward_button"] = tk.Button(
             master=self._frame_dict["search"], command=self._increment_result, text=">"
         )
+        # scope filters, pages are typed 1 based like the page label #
+        self._search_dict["pages_label"] = tk.Label(
+            master=self._frame_dict["search"], text="Pages"
+        )
+        self._search_dict["pages_entry"] = tk.Entry(
+            master=self._frame_dict["search"], width=9, **self._color_args
+        )
+        self._section_var = tk.StringVar(master=self, value=self._all_sections_str)
+        self._search_dict["section_menu"] = tk.OptionMenu(
+            self._frame_dict["search"], self._section_var, self._all_sections_str
+        )
+        self._search_dict["section_menu"]["menu"].configure(
+            postcommand=self._load_sections
+        )
+        self._search_dict["status_label"] = tk.Label(
+            master=self._frame_dict["search"], text="", width=12
+        )
 
     def _create_text_box(self):
         # main text box not in frame so can fill window #
         text_edit_box = tk.Text(master=self, **self._color_args)
         text_edit_box.grid_columnconfigure(0, weight=1)
         text_edit_box.insert(tk.END, self._pdf_content_dict[str(self._current_page)])
+        self._rendered_page = self._current_page
         text_edit_box.tag_configure(
             "start", background="OliveDrab1", foreground="black"
         )
@@ -80,10 +112,12 @@ class DisplayWindow(tk.Tk):
 
     def _decrement_result(self):
         if self._search_results is None:
+            # highlighting happens once the search returns #
             self._search_press()
-            self._n_current_result = 0
-        else:
-            self._n_current_result -= 1
+            return
+        if len(self._search_results) == 0:
+            return
+        self._n_current_result -= 1
         self._n_current_result = (
             0 if self._n_current_result < 0 else self._n_current_result
         )
@@ -94,22 +128,76 @@ class DisplayWindow(tk.Tk):
         button_args.update(**self._color_args)
         return button_args
 
+    def _get_search_scope(self):
+        """
+        Read the pages entry and section menu
+        :return: page_range and section for PDFSearch.search, raises ValueError
+            on a malformed page range
+        """
+        section = self._section_var.get()
+        if section != self._all_sections_str:
+            return None, section
+        pages_str = self._search_dict["pages_entry"].get().strip()
+        if pages_str == "":
+            return None, None
+        page_first, _, page_last = pages_str.partition("-")
+        page_first = int(page_first)
+        page_last = int(page_last) if page_last.strip() != "" else page_first
+        if page_first < 1 or page_last < page_first:
+            raise ValueError(pages_str)
+        return (page_first - 1, page_last - 1), None
+
+    def _get_tk_offset(self, char_offset: int) -> int:
+        """
+        Convert a character offset into the rendered page to a tk text offset
+        :param char_offset: offset in python characters
+        :return: offset in the characters tk counts
+        """
+        if self._astral_width == 1:
+            return char_offset
+        page_contents = self._pdf_content_dict[str(self._rendered_page)]
+        n_astral = sum(1 for x in page_contents[:char_offset] if ord(x) > 0xFFFF)
+        return char_offset + (self._astral_width - 1) * n_astral
+
     def _highlight_result(self):
         curr_result = self._search_results[self._n_current_result]
         page_str = curr_result["id"]
         text_to_highlight = curr_result["metadata"]
-        page_num = int(page_str.split("_")[0])
+        page_num = curr_result.get("page", int(page_str.split("_")[0]))
         self._current_page = page_num
-        self._update_text_box(text_to_highlight=text_to_highlight)
+        self._update_text_box(
+            text_to_highlight=text_to_highlight,
+            char_start=curr_result.get("char_start", -1),
+            char_end=curr_result.get("char_end", -1),
+        )
 
     def _increment_result(self):
         if self._search_results is None:
             self._search_press()
-            self._n_current_result = 0
-        else:
-            self._n_current_result += 1
+            return
+        if len(self._search_results) == 0:
+            return
+        self._n_current_result += 1
+        self._n_current_result = min(
+            self._n_current_result, len(self._search_results) - 1
+        )
         self._highlight_result()
 
+    def _load_sections(self):
+        if self._section_list is not None:
+            return
+        try:
+            self._section_list = self._pdf_crawler.get_sections()
+        except Exception:
+            # a malformed outline only costs the section filter #
+            self._section_list = []
+        section_menu = self._search_dict["section_menu"]["menu"]
+        for section_dict in self._section_list:
+            section_menu.add_command(
+                label=section_dict["title"],
+                command=tk._setit(self._section_var, section_dict["title"]),
+            )
+
     def _next_page(self):
         if self._current_page < len(self._pdf_content_dict) - 1:
             self._current_page += 1
@@ -133,27 +221,92 @@ class DisplayWindow(tk.Tk):
         for text_box_name, curr_text_box in self._text_box_dict.items():
             curr_text_box.pack(expand=True, fill="both")
 
+    def _poll_search_queue(self):
+        """
+        Apply finished searches on the tk thread, dropping superseded ones
+        :return: None
+        """
+        while True:
+            try:
+                search_generation, search_results = self._search_queue.get_nowait()
+            except queue.Empty:
+                break
+            if search_generation != self._search_generation:
+                continue
+            self._search_future = None
+            self._search_dict["status_label"].configure(text="")
+            if isinstance(search_results, Exception):
+                self._search_dict["status_label"].configure(text="Search failed")
+                continue
+            self._search_results = search_results
+            self._n_current_result = 0
+            if len(self._search_results) > 0:
+                self._highlight_result()
+            else:
+                self._search_dict["status_label"].configure(text="No results")
+        if self._search_future is not None:
+            self.after(self._poll_ms, self._poll_search_queue)
+
+    def _run_search(
+        self,
+        search_generation: int,
+        search_str: str,
+        page_range: tuple = None,
+        section: str = None,
+    ):
+        # runs on the worker thread, tk objects must not be touched here #
+        if search_generation != self._search_generation:
+            return
+        try:
+            search_results = self._pdf_crawler.search(
+                string=search_str, page_range=page_range, section=section
+            )
+        except Exception as search_error:
+            search_results = search_error
+        self._search_queue.put((search_generation, search_results))
+
     def _search_press(self):
         search_box = self._search_dict["search_box"]
         search_str = search_box.get("1.0", tk.END)
-        self._search_results = self._pdf_crawler.search(string=search_str)
-        self._n_current_result = 0
-        self._highlight_result()
+        try:
+            page_range, section = self._get_search_scope()
+        except ValueError:
+            self._search_dict["status_label"].configure(text="Bad page range")
+            return
+        if self._search_future is not None:
+            self._search_future.cancel()
+        else:
+            self.after(self._poll_ms, self._poll_search_queue)
+        self._search_generation += 1
+        self._search_dict["status_label"].configure(text="Searching...")
+        self._search_future = self._search_executor.submit(
+            self._run_search, self._search_generation, search_str, page_range, section
+        )
 
-    def _update_text_box(self, text_to_highlight: str = None):
+    def _update_text_box(
+        self, text_to_highlight: str = None, char_start: int = -1, char_end: int = -1
+    ):
         text_edit_box = self._text_box_dict["content"]
         page_label = self._button_dict["label"]
         page_label.configure(
             text=f"Page: {self._current_page + 1}/{len(self._pdf_content_dict)}"
         )
         text_edit_box.config(state=tk.NORMAL)
-        text_edit_box.delete("1.0", "end")
+        text_edit_box.tag_remove("start", "1.0", tk.END)
 
-        # render matching page to get index #
-        page_contents = self._pdf_content_dict[str(self._current_page)]
-        text_edit_box.insert(tk.END, page_contents)
+        # only re-render when the page changes #
+        if self._rendered_page != self._current_page:
+            text_edit_box.delete("1.0", "end")
+            page_contents = self._pdf_content_dict[str(self._current_page)]
+            text_edit_box.insert(tk.END, page_contents)
+            self._rendered_page = self._current_page
 
-        if text_to_highlight is not None:
+        if char_start >= 0 and char_end >= 0:
+            start_idx_combined = f"1.0+{self._get_tk_offset(char_start)}c"
+            end_idx_combined = f"1.0+{self._get_tk_offset(char_end)}c"
+            text_edit_box.tag_add("start", start_idx_combined, end_idx_combined)
+            text_edit_box.see(start_idx_combined)
+        elif text_to_highlight is not None:
             start_idx_combined = text_edit_box.search(
                 text_to_highlight, "1.0", stopindex="end"
             )
@@ -0,0 +1,96 @@
+import json
+import os
+import numpy as np
+from typing import List
+
+SENTENCE_FIELDS = ["sentence_raw", "sentence_clean", "char_start", "char_end"]
+
+
+class EmbeddingCache:
+    def __init__(self, cache_filepath: str, dtype: str = "float32"):
+        self._cache_filepath = cache_filepath
+        self._dtype = dtype
+        self._embed_filepath = cache_filepath + "_embed.npy"
+        self._manifest_filepath = cache_filepath + "_manifest.json"
+        self._raw_filepath = cache_filepath + "_raw.json"
+        self._sentence_filepath = cache_filepath + "_sentences.json"
+
+    def exists(self) -> bool:
+        return all(
+            os.path.exists(x)
+            for x in [
+                self._embed_filepath,
+                self._manifest_filepath,
+                self._raw_filepath,
+                self._sentence_filepath,
+            ]
+        )
+
+    def read_manifest(self) -> dict:
+        with open(self._manifest_filepath, "r") as file_reader:
+            manifest_dict = json.loads(file_reader.read())
+        return manifest_dict
+
+    def read(self, mmap: bool = True) -> dict:
+        """
+        Read cached embeddings, sentences and pages
+        :param mmap: memory-map the embedding matrix instead of reading it
+        :return: dict with ids, sentences, embeddings, pages and canonical_ids,
+            None when the cache was written without them
+        """
+        embedding_arr = np.load(self._embed_filepath, mmap_mode="r" if mmap else None)
+        with open(self._sentence_filepath, "r") as file_reader:
+            column_dict = json.loads(file_reader.read())
+        with open(self._raw_filepath, "r") as file_reader:
+            page_content_dict = json.loads(file_reader.read())
+        assert len(column_dict["ids"]) == len(
+            embedding_arr
+        ), "CACHED IDS AND EMBEDDINGS MUST BE 1 TO 1"
+        assert all(x in column_dict for x in SENTENCE_FIELDS), "CACHE IS OUT OF DATE"
+        sentence_list = [
+            dict(zip(SENTENCE_FIELDS, x))
+            for x in zip(*[column_dict[y] for y in SENTENCE_FIELDS])
+        ]
+        cache_dict = {
+            "ids": column_dict["ids"],
+            "sentences": sentence_list,
+            "embeddings": embedding_arr,
+            "pages": page_content_dict,
+            "canonical_ids": column_dict.get("canonical_ids"),
+        }
+        return cache_dict
+
+    def write(
+        self,
+        ids: List[str],
+        sentences: List[dict],
+        embeddings: np.ndarray,
+        pages: dict,
+        manifest: dict,
+        canonical_ids: List[str] = None,
+    ):
+        cache_dir = os.path.dirname(self._cache_filepath)
+        if len(cache_dir) > 0:
+            os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(self._manifest_filepath):
+            os.remove(self._manifest_filepath)
+        # write then rename so open memory maps of the old matrix stay valid #
+        embed_tmp_filepath = self._embed_filepath + ".tmp.npy"
+        np.save(embed_tmp_filepath, np.ascontiguousarray(embeddings, self._dtype))
+        os.replace(embed_tmp_filepath, self._embed_filepath)
+        # stored column-wise so field names are not repeated per sentence #
+        column_dict = {"ids": list(ids)}
+        for field_name in SENTENCE_FIELDS:
+            column_dict[field_name] = [x[field_name] for x in sentences]
+        if canonical_ids is not None:
+            assert len(canonical_ids) == len(
+                ids
+            ), "IDS AND CANONICAL IDS MUST BE 1 TO 1"
+            column_dict["canonical_ids"] = list(canonical_ids)
+        with open(self._sentence_filepath, "w") as file_writer:
+            file_writer.write(json.dumps(column_dict, separators=(",", ":")))
+        with open(self._raw_filepath, "w") as file_writer:
+            file_writer.write(json.dumps(pages, separators=(",", ":")))
+        # manifest written last so a partial write never looks valid #
+        with open(self._manifest_filepath, "w") as file_writer:
+            file_writer.write(json.dumps(manifest))
@@ -0,0 +1,183 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Callable, List
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def add(self, **counts):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullInstrumentation:
+    """
+    Default instrumentation, every call is a no-op so hot paths pay nothing
+    """
+
+    def stage(self, stage_name: str, **counts):
+        return _NULL_STAGE
+
+    def get_stats(self) -> dict:
+        return {}
+
+    def reset(self):
+        pass
+
+
+class _Stage:
+    def __init__(self, instrumentation, stage_name: str, counts: dict):
+        self._instrumentation = instrumentation
+        self._stage_name = stage_name
+        self._counts = counts
+        self._time_start = None
+        self._traced_start = 0
+
+    def __enter__(self):
+        self._instrumentation._enter_stage()
+        if self._instrumentation._trace_memory:
+            self._traced_start = tracemalloc.get_traced_memory()[0]
+        self._time_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        seconds = time.perf_counter() - self._time_start
+        if self._instrumentation._trace_memory:
+            traced_current, traced_peak = tracemalloc.get_traced_memory()
+            self._counts["alloc_bytes"] = traced_current - self._traced_start
+            self._counts["peak_bytes"] = max(0, traced_peak - self._traced_start)
+        self._instrumentation._exit_stage()
+        self._instrumentation._record(self._stage_name, seconds, self._counts)
+        return False
+
+    def add(self, **counts):
+        """
+        Add counts only known once the stage has run, e.g. sentences produced
+        :param counts: count name to value
+        :return: None
+        """
+        for count_name, count_value in counts.items():
+            self._counts[count_name] = self._counts.get(count_name, 0) + count_value
+
+
+class StageTimer(NullInstrumentation):
+    def __init__(
+        self,
+        callbacks: List[Callable] = None,
+        profile: bool = False,
+        trace_memory: bool = False,
+    ):
+        """
+        Aggregate per-stage durations and counts, optionally profiling them
+        :param callbacks: called with one dict per finished stage
+        :param profile: run cProfile while a stage is active, one thread is
+            profiled at a time
+        :param trace_memory: record allocated and peak bytes per stage with
+            tracemalloc
+        """
+        self._callbacks = [] if callbacks is None else list(callbacks)
+        self._profile = profile
+        self._trace_memory = trace_memory
+        self._profiler = cProfile.Profile() if profile else None
+        self._profiling_thread = None
+        self._stats_dict = {}
+        self._stats_lock = threading.Lock()
+        # stages can run on indexing and search threads at the same time #
+        self._thread_state = threading.local()
+
+    def _enter_stage(self):
+        # nested stages share one profiler and one tracemalloc session #
+        stage_depth = getattr(self._thread_state, "stage_depth", 0)
+        if stage_depth == 0:
+            with self._stats_lock:
+                if self._profile and self._profiling_thread is None:
+                    self._profiling_thread = threading.get_ident()
+                    self._profiler.enable()
+            if self._trace_memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+        self._thread_state.stage_depth = stage_depth + 1
+
+    def _exit_stage(self):
+        self._thread_state.stage_depth -= 1
+        if (
+            self._thread_state.stage_depth == 0
+            and self._profiling_thread == threading.get_ident()
+        ):
+            self._profiler.disable()
+            self._profiling_thread = None
+
+    def _record(self, stage_name: str, seconds: float, counts: dict):
+        with self._stats_lock:
+            stage_stats = self._stats_dict.setdefault(
+                stage_name, {"calls": 0, "seconds": 0.0}
+            )
+            stage_stats["calls"] += 1
+            stage_stats["seconds"] += seconds
+            for count_name, count_value in counts.items():
+                if count_name == "peak_bytes":
+                    stage_stats[count_name] = max(
+                        stage_stats.get(count_name, 0), count_value
+                    )
+                else:
+                    stage_stats[count_name] = (
+                        stage_stats.get(count_name, 0) + count_value
+                    )
+        if len(self._callbacks) > 0:
+            stage_event = {"stage": stage_name, "seconds": seconds}
+            stage_event.update(counts)
+            for callback in self._callbacks:
+                callback(stage_event)
+
+    def add_callback(self, callback: Callable):
+        self._callbacks.append(callback)
+
+    def get_profile(self, sort_by: str = "cumulative", n_rows: int = 30) -> str:
+        assert self._profile, "PROFILING MUST BE ENABLED"
+        stats_stream = io.StringIO()
+        pstats.Stats(self._profiler, stream=stats_stream).sort_stats(
+            sort_by
+        ).print_stats(n_rows)
+        return stats_stream.getvalue()
+
+    def get_stats(self) -> dict:
+        """
+        Totals per stage since the last reset
+        :return: stage name to dict of calls, seconds, counts and per-call mean
+        """
+        stats_dict = {}
+        with self._stats_lock:
+            stats_items = [(x, dict(y)) for x, y in self._stats_dict.items()]
+        for stage_name, stage_stats in stats_items:
+            stats_dict[stage_name] = dict(stage_stats)
+            stats_dict[stage_name]["mean_ms"] = (
+                1000 * stage_stats["seconds"] / stage_stats["calls"]
+            )
+        return stats_dict
+
+    def reset(self):
+        with self._stats_lock:
+            self._stats_dict = {}
+        if self._profile:
+            self._profiler = cProfile.Profile()
+
+    def stage(self, stage_name: str, **counts):
+        """
+        Time a block of work as a named stage
+        :param stage_name: stage to aggregate under
+        :param counts: counts known up front, e.g. n_items or bytes
+        :return: context manager, its add method records counts found later
+        """
+        return _Stage(self, stage_name, counts)
@@ -0,0 +1,97 @@
+import threading
+
+SGPT_MODEL_NAME = "Muennighoff/SGPT-125M-weightedmean-msmarco-specb-bitfit"
+
+
+def load_sgpt_embedder(model_name_or_path: str = SGPT_MODEL_NAME, **kwargs):
+    # torch and sentence_transformers are only imported once a model is needed #
+    from src.sgpt_embedder import SGPTEmbedder
+
+    return SGPTEmbedder(model_name_or_path=model_name_or_path, **kwargs)
+
+
+class LazyEmbedder:
+    def __init__(
+        self,
+        model_name_or_path: str = SGPT_MODEL_NAME,
+        embedder_fn=load_sgpt_embedder,
+        model_name: str = None,
+        n_dims: int = -1,
+        **kwargs,
+    ):
+        """
+        Stand-in for an embedder that builds the real one on first use
+        :param model_name_or_path: model to load
+        :param embedder_fn: called with model_name_or_path and kwargs to build
+            the embedder
+        :param model_name: name the cache is validated against, must match the
+            loaded embedder's get_model_name, defaults to model_name_or_path,
+            ":int8" is appended when kwargs turn on cpu_mode
+        :param n_dims: embedding dimension if known, avoids loading to ask
+        :param kwargs: passed to embedder_fn
+        """
+        self._model_name_or_path = model_name_or_path
+        self._model_name = model_name_or_path if model_name is None else model_name
+        # same suffix as SGPTEmbedder, quantized embeddings get their own cache #
+        if kwargs.get("cpu_mode", False) and not self._model_name.endswith(":int8"):
+            self._model_name += ":int8"
+        self._embedder_fn = embedder_fn
+        self._n_dims = n_dims
+        self._kwargs = kwargs
+        self._embedder = None
+        self._load_error = None
+        self._load_lock = threading.Lock()
+        self._preload_thread = None
+
+    def _get_embedder(self):
+        # callers wait here while a background preload finishes #
+        with self._load_lock:
+            if self._embedder is None:
+                self._embedder = self._embedder_fn(
+                    model_name_or_path=self._model_name_or_path, **self._kwargs
+                )
+        return self._embedder
+
+    def _preload(self):
+        try:
+            self._get_embedder()
+        except Exception as load_error:
+            # raised again from the first call that needs the model #
+            self._load_error = load_error
+
+    def encode(self, sentences, **kwargs):
+        return self.get_embedder().encode(sentences, **kwargs)
+
+    def get_embedder(self):
+        if self._load_error is not None:
+            raise self._load_error
+        return self._get_embedder()
+
+    def get_model_name(self) -> str:
+        return self._model_name
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._n_dims > 0:
+            return self._n_dims
+        return self.get_embedder().get_sentence_embedding_dimension()
+
+    def is_loaded(self) -> bool:
+        return self._embedder is not None
+
+    @property
+    def max_seq_length(self):
+        return getattr(self.get_embedder(), "max_seq_length", None)
+
+    def preload(self) -> threading.Thread:
+        """
+        Start loading the model on a daemon thread
+        :return: the loading thread
+        """
+        if self._preload_thread is None:
+            self._preload_thread = threading.Thread(target=self._preload, daemon=True)
+            self._preload_thread.start()
+        return self._preload_thread
+
+    @property
+    def tokenizer(self):
+        return getattr(self.get_embedder(), "tokenizer", None)
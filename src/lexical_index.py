@@ -0,0 +1,135 @@
+import math
+import threading
+import numpy as np
+from collections import Counter
+from typing import List
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self._k1 = k1
+        self._b = b
+        self._doc_ids = []
+        self._doc_lengths = []
+        self._total_length = 0
+        # term to parallel lists of document rows and term frequencies #
+        self._postings = {}
+        # numpy views of the lists above, rebuilt only for terms that changed #
+        self._posting_arr_dict = {}
+        self._doc_length_arr = None
+        # documents can be added by a background indexer while searching #
+        self._lock = threading.Lock()
+
+    def _get_postings(self, term: str):
+        posting_arr = self._posting_arr_dict.get(term)
+        if posting_arr is None:
+            doc_rows, term_freqs = self._postings[term]
+            posting_arr = (
+                np.asarray(doc_rows, dtype=np.int64),
+                np.asarray(term_freqs, dtype=np.float32),
+            )
+            self._posting_arr_dict[term] = posting_arr
+        return posting_arr
+
+    def _split_terms(self, text: str) -> list:
+        # the cleaner keeps . and ?, a sentence's last word would carry them #
+        return [x for x in (term.strip(".?") for term in text.split()) if x]
+
+    def add_documents(self, ids: List, texts: List[str]):
+        """
+        Index whitespace separated, already cleaned texts, terms lose any
+        leading or trailing . and ?
+        :param ids: external id per text
+        :param texts: cleaned text per id
+        :return: None
+        """
+        assert len(ids) == len(texts), "IDS AND TEXTS MUST BE 1 TO 1"
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                idx_row = len(self._doc_ids)
+                term_list = self._split_terms(text)
+                for term, term_freq in Counter(term_list).items():
+                    posting = self._postings.get(term)
+                    if posting is None:
+                        posting = ([], [])
+                        self._postings[term] = posting
+                    posting[0].append(idx_row)
+                    posting[1].append(term_freq)
+                    self._posting_arr_dict.pop(term, None)
+                self._doc_ids.append(doc_id)
+                self._doc_lengths.append(len(term_list))
+                self._total_length += len(term_list)
+            self._doc_length_arr = None
+
+    def get_doc_ids(self, idx_start: int = 0) -> list:
+        with self._lock:
+            return self._doc_ids[idx_start:]
+
+    def get_n_documents(self) -> int:
+        return len(self._doc_ids)
+
+    def get_n_terms(self) -> int:
+        return len(self._postings)
+
+    def search(self, text: str, k: int = 10, doc_mask: np.ndarray = None) -> tuple:
+        """
+        Rank documents against a cleaned query with BM25
+        :param text: whitespace separated, cleaned query
+        :param k: number of documents to return
+        :param doc_mask: bool per document in the order added, only True
+            documents are returned, documents added after it was built are not
+        :return: list of ids and array of scores, best first, only documents
+            sharing a term with the query are returned
+        """
+        with self._lock:
+            n_docs = len(self._doc_ids)
+            if n_docs == 0:
+                return [], np.zeros(0, dtype=np.float32)
+            if self._doc_length_arr is None:
+                self._doc_length_arr = np.asarray(self._doc_lengths, dtype=np.float32)
+            doc_length_arr = self._doc_length_arr
+            length_norm = self._k1 * (
+                1 - self._b + self._b * doc_length_arr / (self._total_length / n_docs)
+            )
+            scores = np.zeros(n_docs, dtype=np.float32)
+            for term in set(self._split_terms(text)):
+                if term not in self._postings:
+                    continue
+                doc_rows, term_freqs = self._get_postings(term)
+                doc_freq = len(doc_rows)
+                idf = math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+                # each document appears once per term, so plain indexing is safe #
+                scores[doc_rows] += (
+                    idf
+                    * term_freqs
+                    * (self._k1 + 1)
+                    / (term_freqs + length_norm[doc_rows])
+                )
+            if doc_mask is not None:
+                scores[len(doc_mask) :] = 0
+                scores[: len(doc_mask)][~doc_mask[:n_docs]] = 0
+            candidate_rows = np.flatnonzero(scores)
+            if len(candidate_rows) > k:
+                candidate_rows = candidate_rows[
+                    np.argpartition(-scores[candidate_rows], k - 1)[:k]
+                ]
+            candidate_rows = candidate_rows[
+                np.argsort(-scores[candidate_rows], kind="stable")
+            ]
+            return [self._doc_ids[i] for i in candidate_rows], scores[candidate_rows]
+
+
+def fuse_rankings(ranking_list: List[List], k: int = 10, rrf_k: int = 60) -> list:
+    """
+    Combine ranked id lists with reciprocal rank fusion
+    :param ranking_list: id lists, best first
+    :param k: number of ids to return
+    :param rrf_k: rank offset, larger values flatten the gap between ranks
+    :return: list of (id, fused score), best first
+    """
+    # rank based so bm25 scores and l2 distances need no common scale #
+    fused_dict = {}
+    for ranking in ranking_list:
+        for rank, doc_id in enumerate(ranking):
+            fused_dict[doc_id] = fused_dict.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused_dict.items(), key=lambda x: -x[1])[:k]
@@ -0,0 +1,143 @@
+import resource
+import sys
+import time
+import zlib
+import numpy as np
+
+
+def get_peak_rss_mb() -> float:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos reports bytes #
+    return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+
+def make_synthetic_text(
+    n_sentences: int, rng: np.random.Generator, vocab_size: int = 2000
+) -> list:
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    sentence_list = []
+    for _ in range(n_sentences):
+        n_words = int(rng.integers(6, 25))
+        word_list = [vocab[x] for x in rng.zipf(1.3, n_words) % vocab_size]
+        sentence_list.append(" ".join(word_list).capitalize() + ".")
+    return sentence_list
+
+
+def make_synthetic_pdf(
+    pdf_filepath: str,
+    n_pages: int = 50,
+    n_sentences_per_page: int = 30,
+    seed: int = 0,
+    line_width: int = 90,
+):
+    """
+    Write a text-only pdf of random sentences that PyPDF2 can extract
+    :param pdf_filepath: file to write
+    :param n_pages: number of pages
+    :param n_sentences_per_page: sentences on each page
+    :param seed: random seed
+    :param line_width: characters per line before wrapping
+    :return: None
+    """
+    rng = np.random.default_rng(seed)
+    n_objects = 3 + 2 * n_pages
+    font_id = n_objects
+    object_list = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        (
+            "<< /Type /Pages /Kids ["
+            + " ".join(f"{3 + 2 * i} 0 R" for i in range(n_pages))
+            + f"] /Count {n_pages} >>"
+        ).encode(),
+    ]
+    for idx_page in range(n_pages):
+        page_text = " ".join(make_synthetic_text(n_sentences_per_page, rng))
+        line_list = []
+        while len(page_text) > 0:
+            split_idx = page_text.rfind(" ", 0, line_width)
+            split_idx = len(page_text) if len(page_text) <= line_width else split_idx
+            line_list.append(page_text[:split_idx])
+            page_text = page_text[split_idx:].strip()
+        content_str = "BT /F1 9 Tf 11 TL 40 760 Td " + " T* ".join(
+            f"({x}) Tj" for x in line_list
+        )
+        content = (content_str + " ET").encode("latin-1")
+        object_list.append(
+            (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                f"/Resources << /Font << /F1 {font_id} 0 R >> >> "
+                f"/Contents {4 + 2 * idx_page} 0 R >>"
+            ).encode()
+        )
+        object_list.append(
+            f"<< /Length {len(content)} >>\nstream\n".encode()
+            + content
+            + b"\nendstream"
+        )
+    object_list.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    pdf_bytes = b"%PDF-1.4\n"
+    offset_list = []
+    for idx_object, pdf_object in enumerate(object_list):
+        offset_list.append(len(pdf_bytes))
+        pdf_bytes += f"{idx_object + 1} 0 obj\n".encode() + pdf_object + b"\nendobj\n"
+    xref_offset = len(pdf_bytes)
+    pdf_bytes += f"xref\n0 {len(object_list) + 1}\n0000000000 65535 f \n".encode()
+    pdf_bytes += b"".join(f"{x:010d} 00000 n \n".encode() for x in offset_list)
+    pdf_bytes += (
+        f"trailer\n<< /Size {len(object_list) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode()
+    with open(pdf_filepath, "wb") as file_writer:
+        file_writer.write(pdf_bytes)
+
+
+def summarize_timings(seconds_list: list) -> dict:
+    seconds_arr = np.asarray(seconds_list) * 1000
+    return {
+        "n": len(seconds_arr),
+        "mean_ms": float(np.mean(seconds_arr)),
+        "p50_ms": float(np.percentile(seconds_arr, 50)),
+        "p90_ms": float(np.percentile(seconds_arr, 90)),
+        "p99_ms": float(np.percentile(seconds_arr, 99)),
+    }
+
+
+def time_stage(stage_fn) -> dict:
+    """
+    Time one call of a stage
+    :param stage_fn: callable returning the number of items it processed or None
+    :return: dict of seconds, peak rss and throughput
+    """
+    time_start = time.perf_counter()
+    n_items = stage_fn()
+    seconds = time.perf_counter() - time_start
+    stage_dict = {"seconds": seconds, "peak_rss_mb": get_peak_rss_mb()}
+    if n_items is not None:
+        stage_dict["n_items"] = n_items
+        stage_dict["items_per_sec"] = n_items / seconds if seconds > 0 else 0.0
+    return stage_dict
+
+
+class SyntheticEmbedder:
+    def __init__(self, n_dims: int = 768, seconds_per_sentence: float = 0.0):
+        self._n_dims = n_dims
+        self._seconds_per_sentence = seconds_per_sentence
+
+    def encode(self, sentences, **kwargs):
+        is_single = isinstance(sentences, str)
+        sentence_list = [sentences] if is_single else list(sentences)
+        if self._seconds_per_sentence > 0:
+            time.sleep(self._seconds_per_sentence * len(sentence_list))
+        # seeded by text so equal sentences embed equally #
+        embedding_arr = np.zeros((len(sentence_list), self._n_dims), dtype=np.float32)
+        for i, sentence in enumerate(sentence_list):
+            rng = np.random.default_rng(zlib.crc32(sentence.encode("utf-8")))
+            embedding_arr[i] = rng.standard_normal(self._n_dims)
+        return embedding_arr[0] if is_single else embedding_arr
+
+    def get_model_name(self):
+        return f"synthetic-{self._n_dims}"
+
+    def get_sentence_embedding_dimension(self):
+        return self._n_dims
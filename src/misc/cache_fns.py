@@ -0,0 +1,41 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_size: int = 128):
+        self._max_size = max_size
+        self._cache = OrderedDict()
+        self._n_hits = 0
+        self._n_misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+    def get(self, key, default=None):
+        if key not in self._cache:
+            self._n_misses += 1
+            return default
+        self._n_hits += 1
+        self._cache.move_to_end(key)
+        return self._cache[key]
+
+    def get_stats(self) -> dict:
+        n_lookups = self._n_hits + self._n_misses
+        return {
+            "hits": self._n_hits,
+            "misses": self._n_misses,
+            "hit_rate": self._n_hits / n_lookups if n_lookups > 0 else 0.0,
+            "size": len(self._cache),
+            "max_size": self._max_size,
+        }
+
+    def put(self, key, value):
+        if self._max_size <= 0:
+            return
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
@@ -1,5 +1,5 @@
-import pandas as pd
 import gzip
+import hashlib
 import json
 import yaml
 
@@ -12,6 +12,9 @@ def read_file(filepath: str):
             raw_contents = yaml.safe_load(file_reader)
         file_contents = raw_contents
     elif ".csv" in filepath:
+        # pandas is slow to import and only needed for csv files #
+        import pandas as pd
+
         file_contents = pd.read_csv(filepath)
     else:
         with open(filepath, "r") as file_reader:
@@ -39,4 +42,12 @@ def read_json(filepath: str):
 def read_yaml(filepath: str):
     with open(filepath, "r") as file_reader:
         raw_yaml = yaml.safe_load(file_reader)
-    return raw_yaml
\ No newline at end of file
+    return raw_yaml
+
+
+def hash_file(filepath: str, chunk_size: int = 1 << 20) -> str:
+    file_hash = hashlib.sha1()
+    with open(filepath, "rb") as file_reader:
+        for chunk in iter(lambda: file_reader.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
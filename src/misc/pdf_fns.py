@@ -0,0 +1,79 @@
+def get_n_pages(pdf_filepath: str) -> int:
+    import PyPDF2
+
+    with open(pdf_filepath, "rb") as file_reader:
+        n_pages = len(PyPDF2.PdfReader(file_reader).pages)
+    return n_pages
+
+
+def extract_page_range(
+    pdf_filepath: str, idx_start: int, idx_end: int, n_chars_skip: int = 0
+) -> list:
+    import PyPDF2
+
+    # each worker opens its own reader, PdfReader objects are not picklable #
+    with open(pdf_filepath, "rb") as file_reader:
+        pdf_reader = PyPDF2.PdfReader(file_reader)
+        page_content_list = [
+            pdf_reader.pages[i].extract_text()[n_chars_skip:]
+            for i in range(idx_start, idx_end)
+        ]
+    return page_content_list
+
+
+def get_outline_sections(pdf_filepath: str, max_depth: int = 1) -> list:
+    """
+    Read section page ranges from the pdf outline (bookmarks)
+    :param pdf_filepath: pdf to read
+    :param max_depth: outline levels to include, 1 keeps top level entries only
+    :return: dicts of title, depth, page_start and page_end (both inclusive) in
+        page order, empty when the pdf has no outline
+    """
+    import PyPDF2
+
+    with open(pdf_filepath, "rb") as file_reader:
+        pdf_reader = PyPDF2.PdfReader(file_reader)
+        n_pages = len(pdf_reader.pages)
+        entry_list = []
+        # nested lists in the outline hold the children of the entry before them #
+        outline_stack = [(pdf_reader.outline, 1)]
+        while outline_stack:
+            outline, depth = outline_stack.pop()
+            for outline_item in outline:
+                if isinstance(outline_item, list):
+                    if depth < max_depth:
+                        outline_stack.append((outline_item, depth + 1))
+                    continue
+                page_start = pdf_reader.get_destination_page_number(outline_item)
+                if page_start is not None and page_start >= 0:
+                    entry_list.append((page_start, depth, outline_item.title))
+    entry_list.sort(key=lambda x: (x[0], x[1]))
+    section_list = []
+    for i, (page_start, depth, title) in enumerate(entry_list):
+        # a section runs until the next entry at the same or a higher level #
+        page_end = n_pages - 1
+        for page_next, depth_next, _ in entry_list[i + 1 :]:
+            if depth_next <= depth:
+                page_end = max(page_start, page_next - 1)
+                break
+        section_list.append(
+            {
+                "title": title,
+                "depth": depth,
+                "page_start": page_start,
+                "page_end": page_end,
+            }
+        )
+    return section_list
+
+
+def split_range(n_items: int, n_chunks: int) -> list:
+    n_chunks = max(1, min(n_chunks, n_items))
+    chunk_size, remainder = divmod(n_items, n_chunks)
+    range_list = []
+    idx_start = 0
+    for i in range(n_chunks):
+        idx_end = idx_start + chunk_size + (1 if i < remainder else 0)
+        range_list.append((idx_start, idx_end))
+        idx_start = idx_end
+    return range_list
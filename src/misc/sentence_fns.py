@@ -0,0 +1,90 @@
+import json
+from src.misc.string_fns import StringCleaner
+
+# one cleaner per config per worker process, so its word cache spans chunks #
+_cleaner_dict = {}
+
+
+def get_sentence_offsets(
+    page_content: str, sentence_list: list, n_chars_skip: int = 0
+) -> list:
+    """
+    Locate each sentence in the page it was tokenized from
+    :param page_content: page text, sentences were tokenized after n_chars_skip
+    :param sentence_list: sentences in page order
+    :param n_chars_skip: characters skipped before tokenizing
+    :return: (char_start, char_end) per sentence, (-1, -1) if not found
+    """
+    offset_list = []
+    idx_char = n_chars_skip
+    for sentence_raw in sentence_list:
+        # sentences come back in page order, so search from the last end #
+        char_start = page_content.find(sentence_raw, idx_char)
+        if char_start < 0:
+            offset_list.append((-1, -1))
+        else:
+            idx_char = char_start + len(sentence_raw)
+            offset_list.append((char_start, idx_char))
+    return offset_list
+
+
+def make_sentence_records(
+    idx_page: int, sentence_raw_list: list, sentence_clean_list: list, offset_list
+) -> list:
+    return [
+        (
+            f"{idx_page}_{idx_sentence}",
+            {
+                "sentence_raw": sentence_raw_list[idx_sentence],
+                "sentence_clean": sentence_clean_list[idx_sentence],
+                "char_start": offset_list[idx_sentence][0],
+                "char_end": offset_list[idx_sentence][1],
+            },
+        )
+        for idx_sentence in range(len(sentence_raw_list))
+    ]
+
+
+def label_page_chunk(
+    page_chunk: list,
+    char_replace_dict: dict,
+    n_chars_skip: int = 0,
+    word_split_char: str = " ",
+    sentence_join_char: str = " ",
+) -> list:
+    """
+    Tokenize and clean a chunk of pages, run in a worker process
+    :param page_chunk: list of (page index, page text)
+    :param char_replace_dict: StringCleaner replace rules
+    :param n_chars_skip: characters skipped at the start of each page
+    :param word_split_char: StringCleaner word separator
+    :param sentence_join_char: StringCleaner sentence joiner
+    :return: (id, sentence dict) per sentence, in page then sentence order
+    """
+    from nltk.tokenize import sent_tokenize
+
+    cleaner_key = (
+        json.dumps(char_replace_dict, sort_keys=True),
+        word_split_char,
+        sentence_join_char,
+    )
+    string_cleaner = _cleaner_dict.get(cleaner_key)
+    if string_cleaner is None:
+        string_cleaner = StringCleaner(
+            char_replace_dict,
+            word_split_char=word_split_char,
+            sentence_join_char=sentence_join_char,
+        )
+        _cleaner_dict[cleaner_key] = string_cleaner
+    record_list = []
+    for idx_page, page_content in page_chunk:
+        sentence_raw_list = sent_tokenize(page_content[n_chars_skip:])
+        record_list.extend(
+            make_sentence_records(
+                idx_page,
+                sentence_raw_list,
+                [string_cleaner.clean_sentence(x) for x in sentence_raw_list],
+                get_sentence_offsets(page_content, sentence_raw_list, n_chars_skip),
+            )
+        )
+    return record_list
@@ -1,3 +1,4 @@
+import hashlib
 import re
 
 
@@ -6,3 +7,60 @@ def clean_string(contents_raw: str, replace_dict: dict) -> str:
     for initial_char, replace_char in replace_dict.items():
         contents_clean = re.sub(initial_char, replace_char, contents_clean)
     return contents_clean.strip()
+
+
+def normalize_whitespace(contents: str) -> str:
+    return " ".join(contents.split())
+
+
+def hash_string(contents: str) -> str:
+    return hashlib.sha1(contents.encode("utf-8")).hexdigest()
+
+
+class StringCleaner:
+    def __init__(
+        self,
+        replace_dict: dict,
+        word_split_char: str = " ",
+        sentence_join_char: str = " ",
+        max_cache_size: int = 1 << 20,
+    ):
+        self._pattern_list = [
+            (re.compile(initial_char), replace_char)
+            for initial_char, replace_char in replace_dict.items()
+        ]
+        self._word_split_char = word_split_char
+        self._sentence_join_char = sentence_join_char
+        self._max_cache_size = max_cache_size
+        self._word_cache = {}
+
+    def clean(self, contents_raw: str) -> str:
+        """
+        Apply every replace rule to the whole string, same output as clean_string
+        :param contents_raw: string to clean
+        :return: cleaned string
+        """
+        contents_clean = contents_raw
+        for pattern, replace_char in self._pattern_list:
+            contents_clean = pattern.sub(replace_char, contents_clean)
+        return contents_clean.strip()
+
+    def clean_sentence(self, sentence_raw: str) -> str:
+        """
+        Lowercase, split and clean a sentence word by word, caching cleaned words
+        :param sentence_raw: sentence to clean
+        :return: cleaned words joined by sentence_join_char
+        """
+        word_list_clean = []
+        for word in sentence_raw.lower().split(self._word_split_char):
+            word = word.strip()
+            if len(word) == 0:
+                continue
+            word_clean = self._word_cache.get(word)
+            if word_clean is None:
+                if len(self._word_cache) >= self._max_cache_size:
+                    self._word_cache.clear()
+                word_clean = self.clean(word)
+                self._word_cache[word] = word_clean
+            word_list_clean.append(word_clean)
+        return self._sentence_join_char.join(word_list_clean)
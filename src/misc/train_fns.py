@@ -1,3 +1,9 @@
+import hashlib
+import itertools
+import json
+import os
+import queue
+import threading
 import numpy as np
 import torch
 from sklearn.preprocessing import OneHotEncoder
@@ -48,3 +54,147 @@ def data_feeder_batch(
         tokenized_data = tokenizer.batch_encode_plus(to_encode.tolist(), return_tensors='pt', padding=True).to(device)
         idx += batch_size
         yield tokenized_data, y_vals
+
+
+def get_dataset_fingerprint(
+        tokenizer,
+        x_data: np.ndarray,
+        y_data: np.ndarray
+):
+    # any change to the texts, labels or vocabulary invalidates cached token ids #
+    hasher = hashlib.sha256()
+    hasher.update(str(getattr(tokenizer, 'name_or_path', type(tokenizer).__name__)).encode('utf-8'))
+    vocab_dict = tokenizer.get_vocab() if hasattr(tokenizer, 'get_vocab') else {}
+    hasher.update(json.dumps(sorted(vocab_dict.items())).encode('utf-8'))
+    for text in np.asarray(x_data).tolist():
+        hasher.update(str(text).encode('utf-8') + b'\0')
+    hasher.update(json.dumps(np.asarray(y_data).tolist(), default=str).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def tokenize_dataset(
+        tokenizer,
+        x_data: np.ndarray,
+        y_data: np.ndarray,
+        cache_filepath: str = None
+):
+    # token ids stored ragged (flat ids + offsets) so nothing is padded until batching #
+    fingerprint = get_dataset_fingerprint(tokenizer, x_data, y_data) if cache_filepath is not None else ''
+    if cache_filepath is not None and os.path.exists(cache_filepath):
+        with np.load(cache_filepath) as cache_file:
+            token_store = {x: cache_file[x] for x in cache_file.files}
+        if str(token_store.get('fingerprint', '')) == fingerprint:
+            return token_store
+
+    input_id_list = tokenizer(np.asarray(x_data).tolist())['input_ids']
+    lengths = np.asarray([len(x) for x in input_id_list], dtype=np.int64)
+    classes, labels = np.unique(np.asarray(y_data), return_inverse=True)
+    # object arrays would need pickling to round trip through the npz cache #
+    classes = classes.astype(str) if classes.dtype == object else classes
+    token_store = {
+        'input_ids': np.fromiter(itertools.chain.from_iterable(input_id_list), dtype=np.int64, count=int(lengths.sum())),
+        'offsets': np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64),
+        'lengths': lengths,
+        'labels': labels.astype(np.int64),
+        'classes': classes,
+        'fingerprint': np.asarray(fingerprint)
+    }
+    if cache_filepath is not None:
+        np.savez(cache_filepath, **token_store)
+    return token_store
+
+
+def bucket_batches(
+        lengths: np.ndarray,
+        batch_size: int,
+        shuffle: bool = True,
+        seed: int = None
+):
+    # batches hold similar lengths, so padding stays close to the real token count #
+    rng = np.random.default_rng(seed)
+    tie_break = rng.random(len(lengths)) if shuffle else np.arange(len(lengths))
+    sorted_idx = np.lexsort((tie_break, lengths))
+    batch_list = [sorted_idx[i:(i+batch_size)] for i in range(0, len(sorted_idx), batch_size)]
+    if shuffle:
+        batch_list = [batch_list[i] for i in rng.permutation(len(batch_list))]
+    return batch_list
+
+
+def pad_batch(
+        token_store: dict,
+        batch_idx: np.ndarray,
+        pad_token_id: int = 0
+):
+    lengths = token_store['lengths'][batch_idx]
+    position_arr = np.arange(lengths.max())
+    attention_mask = (position_arr[None, :] < lengths[:, None]).astype(np.int64)
+    gather_idx = np.minimum(token_store['offsets'][batch_idx][:, None] + position_arr[None, :], len(token_store['input_ids']) - 1)
+    input_ids = np.where(attention_mask == 1, token_store['input_ids'][gather_idx], pad_token_id)
+    return input_ids, attention_mask, token_store['labels'][batch_idx]
+
+
+def data_loader(
+        tokenizer,
+        x_data: np.ndarray,
+        y_data: np.ndarray,
+        batch_size: int,
+        device: str = 'cuda',
+        cache_filepath: str = None,
+        n_prefetch: int = 4,
+        shuffle: bool = True,
+        seed: int = None
+):
+    """
+    Replacement for data_feeder_batch: tokenizes once, buckets by length and
+    prefetches padded batches on a background thread
+    :param tokenizer: huggingface tokenizer
+    :param x_data: texts
+    :param y_data: labels, mapped to integer class ids in sorted order
+    :param batch_size: examples per batch
+    :param device: device the batches are moved to
+    :param cache_filepath: .npz file the tokenized dataset is stored in and read from
+    :param n_prefetch: batches prepared ahead of the consumer
+    :param shuffle: shuffle examples within a length and the batch order
+    :param seed: random seed
+    :return: generator of ({'input_ids', 'attention_mask'}, integer labels)
+    """
+    token_store = tokenize_dataset(tokenizer, x_data, y_data, cache_filepath=cache_filepath)
+    batch_list = bucket_batches(token_store['lengths'], batch_size, shuffle=shuffle, seed=seed)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+    batch_queue = queue.Queue(maxsize=n_prefetch)
+    end_of_data = object()
+    stop_event = threading.Event()
+
+    def produce_batches():
+        try:
+            for batch_idx in batch_list:
+                input_ids, attention_mask, labels = pad_batch(token_store, batch_idx, pad_token_id)
+                batch = (torch.from_numpy(input_ids), torch.from_numpy(attention_mask), torch.from_numpy(labels))
+                if str(device).startswith('cuda'):
+                    batch = tuple(x.pin_memory() for x in batch)
+                while not stop_event.is_set():
+                    try:
+                        batch_queue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop_event.is_set():
+                    return
+            batch_queue.put(end_of_data)
+        except Exception as batch_error:
+            batch_queue.put(batch_error)
+
+    producer_thread = threading.Thread(target=produce_batches, daemon=True)
+    producer_thread.start()
+    try:
+        while True:
+            batch = batch_queue.get()
+            if batch is end_of_data:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            input_ids, attention_mask, labels = [x.to(device, non_blocking=True) for x in batch]
+            yield {'input_ids': input_ids, 'attention_mask': attention_mask}, labels
+    finally:
+        # consumer stopped early, let the producer exit instead of blocking on put #
+        stop_event.set()
@@ -1,14 +1,39 @@
 import json
+import time
 import warnings
 import numpy as np
 import os
-import PyPDF2
-from nltk.tokenize import sent_tokenize
-from tqdm import tqdm
-from src.misc import read_file
-from src.misc.string_fns import clean_string
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+from src.misc.cache_fns import LRUCache
+from src.misc.file_fns import hash_file, read_file
+from src.misc.pdf_fns import (
+    extract_page_range,
+    get_n_pages,
+    get_outline_sections,
+    split_range,
+)
+from src.misc.sentence_fns import (
+    get_sentence_offsets,
+    label_page_chunk,
+    make_sentence_records,
+)
+from src.misc.string_fns import StringCleaner, hash_string, normalize_whitespace
+from src.embedding_cache import EmbeddingCache
+from src.instrumentation import NullInstrumentation
+from src.lexical_index import BM25Index, fuse_rankings
+from src.sentence_dedup import SentenceDeduplicator
 from src.vector_db import VectorDB
-from sentence_transformers import SentenceTransformer
+
+# heavy modules are imported where first used so a warm start stays fast #
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+DEDUP_MODES = ["none", "exact", "near"]
+SEARCH_MODES = ["vector", "lexical", "hybrid"]
 
 
 class PDFSearch:
@@ -16,23 +41,60 @@ class PDFSearch:
         self,
         pdf_filepath: str,
         char_config_filepath: str,
+        build_lexical_index: bool = True,
         cache_dir: str = "cache",
+        cache_dtype: str = "float32",
+        count_tokens: bool = None,
+        dedup: str = "exact",
+        embed_batch_size: int = 64,
+        embed_device: str = None,
         embedding_dims: int = -1,
-        embedder: SentenceTransformer = None,
+        embedder: "SentenceTransformer" = None,
+        hybrid_candidates: int = 50,
+        instrumentation=None,
         load_from_cache: bool = True,
         n_chars_skip: int = 0,
+        n_workers: int = 1,
+        parallel_min_pages: int = 64,
+        query_cache_size: int = 128,
         save_to_cache: bool = True,
+        search_mode: str = "vector",
         sentence_join_char: str = " ",
+        stream_chunk_pages: int = 32,
         verbose: bool = True,
         use_raw_metadata: bool = True,
+        vector_db_args: dict = None,
         word_split_char: str = " ",
         **kwargs,
     ):
+        assert search_mode in SEARCH_MODES, "SEARCH MODE MUST BE ONE OF " + ", ".join(
+            SEARCH_MODES
+        )
+        assert dedup in DEDUP_MODES, "DEDUP MUST BE ONE OF " + ", ".join(DEDUP_MODES)
+        self._cache_dtype = cache_dtype
+        self._dedup = dedup
         self._char_config_filepath = char_config_filepath
+        self._embed_batch_size = embed_batch_size
+        self._embed_device = embed_device
+        self._embedding_dims = embedding_dims
         self._embedder = embedder
+        self._hybrid_candidates = hybrid_candidates
+        self._instrumentation = (
+            NullInstrumentation() if instrumentation is None else instrumentation
+        )
+        # tokenizing again costs every batch, so only when someone reads the counts #
+        self._count_tokens = (
+            type(self._instrumentation) is not NullInstrumentation
+            if count_tokens is None
+            else count_tokens
+        )
         self._n_chars_skip = n_chars_skip
+        self._n_workers = n_workers if n_workers > 0 else os.cpu_count()
+        self._parallel_min_pages = parallel_min_pages
         self._pdf_filepath = pdf_filepath
+        self._search_mode = search_mode
         self._sentence_join_char = sentence_join_char
+        self._stream_chunk_pages = stream_chunk_pages
         self._verbose = verbose
         self._word_split_char = word_split_char
         self._use_raw_metadata = use_raw_metadata
@@ -44,58 +106,185 @@ class PDFSearch:
             cache_dir, pdf_filepath.split(self._filepath_join_char)[-1]
         )
 
+        self._cache_dict = None
+        self._cache_manifest = None
+        self._canonical_dict = {}
+        self._cached_row_dict = {}
         self._char_config = None
+        self._embedding_cache = None
+        self._embedding_arr = None
         self._embedded_dict = {}
+        self._embed_stats = {
+            "n_sentences": 0,
+            "n_tokens": 0,
+            "n_words": 0,
+            "n_batches": 0,
+            "seconds": 0.0,
+        }
+        self._index_dirpath = None
+        self._index_thread = None
+        self._lexical_index = BM25Index() if build_lexical_index else None
+        self._group_dict = {}
+        self._lexical_group_arr = np.zeros(0, dtype=np.int64)
+        self._occurrence_dict = {}
+        # group and page per sentence, for page filters that see every occurrence #
+        self._occurrence_group_arr = np.zeros(0, dtype=np.int64)
+        self._occurrence_page_arr = np.zeros(0, dtype=np.int64)
+        self._page_hash_dict = {}
         self._pdf_content_raw = None
-        self._vector_index = VectorDB(
-            embedding_dims
-            if embedding_dims > 0
-            else embedder.get_sentence_embedding_dimension()
+        self._pdf_hash = None
+        self._query_embed_cache = LRUCache(query_cache_size)
+        self._query_result_cache = LRUCache(query_cache_size)
+        self._query_cache_version = None
+        self._section_list = None
+        self._sentence_deduplicator = None
+        self._string_cleaner = None
+        self._vector_db_args = {} if vector_db_args is None else dict(vector_db_args)
+        self._vector_db_args.setdefault("instrumentation", self._instrumentation)
+        # created in config, once the cache can say how many dims to expect #
+        self._vector_index = None
+
+    def _add_chunks_to_vector_db(self, chunk_list: list):
+        self._add_to_vector_db(
+            np.concatenate([x[0] for x in chunk_list]),
+            {idx: x for chunk in chunk_list for idx, x in chunk[1]},
         )
 
+    def _add_to_lexical_index(self, sentence_dict: dict):
+        if self._lexical_index is None:
+            return
+        sentence_dict = {
+            idx: x
+            for idx, x in sentence_dict.items()
+            if self._canonical_dict.get(idx, idx) == idx
+        }
+        with self._instrumentation.stage("lexical_add", n_items=len(sentence_dict)):
+            self._lexical_index.add_documents(
+                list(sentence_dict.keys()),
+                [x["sentence_clean"] for x in sentence_dict.values()],
+            )
+
+    def _add_to_vector_db(
+        self, embedding_arr: np.ndarray, sentence_dict: dict, raw_metadata: bool = None
+    ):
+        """
+        Add embeddings to the vector index with their sentence and location
+        :param embedding_arr: one row per entry of sentence_dict
+        :param sentence_dict: sentence dicts keyed by "{page}_{sentence}" id
+        :param raw_metadata: store raw sentences as metadata, else clean ones
+        :return: None
+        """
+        raw_metadata = self._use_raw_metadata if raw_metadata is None else raw_metadata
+        # duplicates share their canonical sentence's row and are found through it #
+        is_canonical = [self._canonical_dict.get(x, x) == x for x in sentence_dict]
+        if not all(is_canonical):
+            embedding_arr = embedding_arr[np.flatnonzero(is_canonical)]
+            sentence_dict = {
+                idx: x
+                for (idx, x), keep in zip(sentence_dict.items(), is_canonical)
+                if keep
+            }
+        metadata_to_use = "sentence_raw" if raw_metadata else "sentence_clean"
+        vector_ids = list(sentence_dict.keys())
+        sentence_dict_list = list(sentence_dict.values())
+        # vectors go in first, lexical hits must always resolve in the vector index #
+        self._vector_index.add_vectors(
+            vectors=embedding_arr,
+            ids=vector_ids,
+            metadata=[x[metadata_to_use] for x in sentence_dict_list],
+            attributes={
+                "page": [int(x.split("_")[0]) for x in vector_ids],
+                "group": [self._group_dict[x] for x in vector_ids],
+                "char_start": [x["char_start"] for x in sentence_dict_list],
+                "char_end": [x["char_end"] for x in sentence_dict_list],
+            },
+        )
+        self._add_to_lexical_index(sentence_dict)
+
     def _check_for_cache(self):
+        """
+        Load the cache if it was built from the same pdf, cleaning config and model
+        :return: True if the cache is valid, False if pages must be (re)built
+        """
         if not self._load_from_cache:
             return False
-        if os.path.exists(self._cache_filepath) and os.path.exists(
-            self._cache_raw_filepath
+        if not self._embedding_cache.exists():
+            return False
+        try:
+            with self._instrumentation.stage("cache_read"):
+                cache_manifest = self._embedding_cache.read_manifest()
+                cache_dict = self._embedding_cache.read(mmap=True)
+        except (OSError, ValueError, KeyError, AssertionError):
+            warnings.warn("CACHE NOT FOUND, BUILDING FROM SCRATCH")
+            return False
+        if (
+            cache_manifest.get("config_hash") != self._get_config_hash()
+            or cache_manifest.get("model_name") != self._get_model_name()
         ):
-            with open(self._cache_filepath, "r") as file_reader:
-                raw_data_dict = file_reader.read()
-            with open(self._cache_raw_filepath, "r") as file_reader:
-                raw_page_data = file_reader.read()
-            try:
-                self._embedded_dict = json.loads(raw_data_dict)
-                self._pdf_content_raw = json.loads(raw_page_data)
-                return True
-            except:
-                warnings.warn("CACHE NOT FOUND, BUILDING FROM SCRATCH")
-                return False
-
-    def _clean_and_label_sentences(self, char_replace_dict: dict):
-        to_iterate = (
-            tqdm(range(len(self._pdf_content_raw)))
-            if self._verbose
-            else range(len(self._pdf_content_raw))
-        )
-        for idx_page in to_iterate:
-            selected_page = self._pdf_content_raw[str(idx_page)][self._n_chars_skip :]
-            page_tokenized = sent_tokenize(selected_page)
-            for idx_sentence in range(len(page_tokenized)):
-                sentence_raw = page_tokenized[idx_sentence]
-                word_list = [
-                    s.lower().strip()
-                    for s in sentence_raw.split(self._word_split_char)
-                    if len(s.lower().strip()) > 0
-                ]
-                word_list_clean = [
-                    clean_string(s, char_replace_dict) for s in word_list
-                ]
-                sentence_clean = self._sentence_join_char.join(word_list_clean)
-                idx_combined = f"{idx_page}_{idx_sentence}"
-                self._embedded_dict[idx_combined] = {
-                    "sentence_raw": sentence_raw,
-                    "sentence_clean": sentence_clean,
-                }
+            warnings.warn("CACHE CONFIG OR MODEL CHANGED, BUILDING FROM SCRATCH")
+            return False
+
+        # cache matches config and model, so unchanged pages can be reused #
+        self._cache_manifest = cache_manifest
+        self._cache_dict = cache_dict
+        if cache_manifest.get("pdf_hash") != self._pdf_hash:
+            return False
+        self._embedded_dict = dict(zip(cache_dict["ids"], cache_dict["sentences"]))
+        self._embedding_arr = cache_dict["embeddings"]
+        self._page_hash_dict = cache_manifest["page_hashes"]
+        self._pdf_content_raw = cache_dict["pages"]
+        return True
+
+    def _clean_and_label_parallel(self, char_replace_dict: dict, page_list):
+        """
+        Tokenize and clean pages in a process pool, chunks come back in
+        submission order so ids match the serial path
+        :param char_replace_dict: StringCleaner replace rules
+        :param page_list: indexes of pages to process
+        :return: None
+        """
+        range_list = split_range(len(page_list), self._n_workers * 4)
+        page_chunk_list = [
+            [(i, self._pdf_content_raw[str(i)]) for i in page_list[x[0] : x[1]]]
+            for x in range_list
+        ]
+        with self._instrumentation.stage(
+            "tokenize_clean", n_items=len(page_list)
+        ) as stage:
+            with ProcessPoolExecutor(max_workers=self._n_workers) as executor:
+                chunk_iter = executor.map(
+                    label_page_chunk,
+                    page_chunk_list,
+                    [char_replace_dict] * len(page_chunk_list),
+                    [self._n_chars_skip] * len(page_chunk_list),
+                    [self._word_split_char] * len(page_chunk_list),
+                    [self._sentence_join_char] * len(page_chunk_list),
+                )
+                to_iterate = self._progress(chunk_iter, total=len(page_chunk_list))
+                for record_list in to_iterate:
+                    self._embedded_dict.update(record_list)
+                    stage.add(n_sentences=len(record_list))
+
+    def _clean_and_label_sentences(self, char_replace_dict: dict, page_list=None):
+        page_list = (
+            range(len(self._pdf_content_raw)) if page_list is None else page_list
+        )
+        if self._n_workers > 1 and len(page_list) >= self._parallel_min_pages:
+            self._clean_and_label_parallel(char_replace_dict, page_list)
+            return
+        to_iterate = self._progress(page_list)
+        string_cleaner = StringCleaner(
+            char_replace_dict,
+            word_split_char=self._word_split_char,
+            sentence_join_char=self._sentence_join_char,
+        )
+        page_iter = (
+            (idx_page, self._pdf_content_raw[str(idx_page)]) for idx_page in to_iterate
+        )
+        for idx_combined, sentence_dict in self._iter_sentences(
+            page_iter, string_cleaner
+        ):
+            self._embedded_dict[idx_combined] = sentence_dict
 
     def _clean_cache_filepath(self):
         self._cache_filepath = (
@@ -103,84 +292,915 @@ class PDFSearch:
             if "." in self._cache_filepath
             else self._cache_filepath
         )
-        self._cache_raw_filepath = self._cache_filepath + "_raw"
+        self._embedding_cache = EmbeddingCache(
+            self._cache_filepath, dtype=self._cache_dtype
+        )
+        self._index_dirpath = self._cache_filepath + "_index"
+
+    def _create_vector_db(self):
+        """
+        Create the empty VectorDB, taking the dimension from the cache when it
+        matches so the embedder does not have to be loaded to ask
+        :return: None
+        """
+        if self._embedding_dims > 0:
+            n_dims = self._embedding_dims
+        elif self._cache_manifest is not None and "n_dims" in self._cache_manifest:
+            n_dims = self._cache_manifest["n_dims"]
+        else:
+            n_dims = self._embedder.get_sentence_embedding_dimension()
+        self._vector_index = VectorDB(n_dims, **self._vector_db_args)
+
+    def _dedup_sentences(self, sentence_list: list) -> list:
+        """
+        Group sentences with the same (or, in near mode, similar) clean text,
+        continuing from the groups of earlier calls since _reset_dedup
+        :param sentence_list: (id, sentence dict) in id order
+        :return: ids that start a new group and need embedding
+        """
+        idx_list = [x[0] for x in sentence_list]
+        if self._sentence_deduplicator is None:
+            canonical_list = idx_list
+        else:
+            with self._instrumentation.stage("dedup", n_items=len(idx_list)):
+                canonical_list = self._sentence_deduplicator.add(
+                    idx_list, [x[1]["sentence_clean"] for x in sentence_list]
+                )
+        return self._register_groups(idx_list, canonical_list)
+
+    def _embed_batched(
+        self, sentence_list: list, progress_bar: bool = True
+    ) -> np.ndarray:
+        """
+        Embed sentences in length-sorted batches, returning rows in input order
+        :param sentence_list: sentences to embed
+        :param progress_bar: show a progress bar when verbose
+        :return: float32 array of shape (len(sentence_list), n_dims)
+        """
+        # sort by length so each batch pads to similar sized inputs #
+        sorted_idx = np.argsort([len(s) for s in sentence_list], kind="stable")
+        batch_list = [
+            sorted_idx[i : i + self._embed_batch_size]
+            for i in range(0, len(sorted_idx), self._embed_batch_size)
+        ]
+        encode_kwargs = {
+            "batch_size": self._embed_batch_size,
+            "show_progress_bar": False,
+        }
+        if self._embed_device is not None:
+            encode_kwargs["device"] = self._embed_device
+
+        embedding_arr = None
+        to_iterate = self._progress(batch_list) if progress_bar else batch_list
+        for batch_idx in to_iterate:
+            batch_sentences = [sentence_list[i] for i in batch_idx]
+            n_words = sum(len(s.split()) for s in batch_sentences)
+            n_tokens = self._get_n_tokens(batch_sentences)
+            time_start = time.perf_counter()
+            with self._instrumentation.stage(
+                "embed",
+                n_items=len(batch_sentences),
+                n_tokens=n_tokens,
+                n_words=n_words,
+            ):
+                batch_embed = np.asarray(
+                    self._embedder.encode(batch_sentences, **encode_kwargs),
+                    dtype=np.float32,
+                )
+            self._embed_stats["seconds"] += time.perf_counter() - time_start
+            self._embed_stats["n_sentences"] += len(batch_sentences)
+            self._embed_stats["n_tokens"] += n_tokens
+            self._embed_stats["n_words"] += n_words
+            self._embed_stats["n_batches"] += 1
+            if embedding_arr is None:
+                embedding_arr = np.zeros(
+                    (len(sentence_list), batch_embed.shape[-1]), dtype=np.float32
+                )
+            embedding_arr[batch_idx] = batch_embed
+        if embedding_arr is None:
+            embedding_arr = np.zeros(
+                (0, self._vector_index.get_n_dims()), dtype=np.float32
+            )
+        return embedding_arr
 
     def _embed_strings(self, verbose: bool = True):
         if verbose:
             print("Embedding Strings")
-        to_iterate = (
-            tqdm(self._embedded_dict.items())
-            if self._verbose
-            else self._embedded_dict.items()
-        )
-        for idx, sentence_dict in to_iterate:
-            sentence_clean = sentence_dict["sentence_clean"]
-            sentence_raw = sentence_dict["sentence_raw"]
-            sentence_embed = self._embedder.encode(sentence_clean).tolist()
-            self._embedded_dict[idx] = {
-                "sentence_clean": sentence_clean,
-                "sentence_raw": sentence_raw,
-                "embed": sentence_embed,
-            }
+        # keep ids in page, sentence order so cache rows stay stable #
+        idx_list = sorted(
+            self._embedded_dict.keys(),
+            key=lambda x: tuple(int(y) for y in x.split("_")),
+        )
+        self._embedded_dict = {idx: self._embedded_dict[idx] for idx in idx_list}
+        self._reset_dedup()
+        canonical_list = self._dedup_sentences(list(self._embedded_dict.items()))
+        # a group reuses the cached row of any of its members #
+        cached_row_arr = np.asarray(
+            [
+                next(
+                    (
+                        self._cached_row_dict[x]
+                        for x in self._occurrence_dict[idx]
+                        if x in self._cached_row_dict
+                    ),
+                    -1,
+                )
+                for idx in canonical_list
+            ],
+            dtype=np.int64,
+        )
+        is_cached = cached_row_arr >= 0
+        sentence_list = [
+            self._embedded_dict[idx]["sentence_clean"]
+            for idx, cached in zip(canonical_list, is_cached)
+            if not cached
+        ]
+        embedding_new = self._embed_batched(sentence_list)
+        embedding_group = np.zeros(
+            (len(canonical_list), embedding_new.shape[-1]), dtype=np.float32
+        )
+        embedding_group[~is_cached] = embedding_new
+        if is_cached.any():
+            embedding_group[is_cached] = self._cache_dict["embeddings"][
+                cached_row_arr[is_cached]
+            ]
+        # every id keeps a cache row, duplicates repeat their group's embedding #
+        group_row_dict = {idx: i for i, idx in enumerate(canonical_list)}
+        self._embedding_arr = embedding_group[
+            [group_row_dict[self._canonical_dict[idx]] for idx in idx_list]
+        ]
+        self._cached_row_dict = {}
+        self._cache_dict = None
         if self._save_to_cache:
             self._write_to_cache()
 
+    def _fuse_results(
+        self,
+        string: str,
+        vector_ids: list,
+        k: int,
+        return_metadata: bool,
+        page_range: tuple = None,
+    ) -> list:
+        n_candidates = max(k, self._hybrid_candidates)
+        lexical_ids, _ = self._query_lexical_index(string, n_candidates, page_range)
+        fused_list = fuse_rankings([list(vector_ids), lexical_ids], k=k)
+        search_results = self._vector_index.get_items(
+            [x[0] for x in fused_list], return_metadata=return_metadata
+        )
+        for vector_info, (_, fused_score) in zip(search_results, fused_list):
+            vector_info["score"] = fused_score
+        return search_results
+
+    def _get_config_hash(self) -> str:
+        config_dict = {
+            "replace": self._char_config["replace"],
+            "n_chars_skip": self._n_chars_skip,
+            "sentence_join_char": self._sentence_join_char,
+            "word_split_char": self._word_split_char,
+        }
+        return hash_string(json.dumps(config_dict, sort_keys=True))
+
+    def _get_groups_in_range(self, page_range: tuple) -> np.ndarray:
+        """
+        Dedup groups with at least one occurrence inside a page range
+        :param page_range: (first, last) pages, both inclusive
+        :return: sorted group numbers
+        """
+        # postings are extended as the background indexer adds sentences #
+        n_known = len(self._occurrence_page_arr)
+        if len(self._canonical_dict) > n_known:
+            canonical_list = list(self._canonical_dict.items())[n_known:]
+            self._occurrence_group_arr = np.concatenate(
+                [
+                    self._occurrence_group_arr,
+                    np.asarray(
+                        [self._group_dict[x[1]] for x in canonical_list], np.int64
+                    ),
+                ]
+            )
+            self._occurrence_page_arr = np.concatenate(
+                [
+                    self._occurrence_page_arr,
+                    np.asarray(
+                        [int(x[0].split("_")[0]) for x in canonical_list], np.int64
+                    ),
+                ]
+            )
+        is_in_range = (self._occurrence_page_arr >= page_range[0]) & (
+            self._occurrence_page_arr <= page_range[1]
+        )
+        return np.unique(self._occurrence_group_arr[is_in_range])
+
+    def _get_index_stamp(self) -> dict:
+        return {
+            "attributes": ["page", "group", "char_start", "char_end"],
+            "config_hash": self._get_config_hash(),
+            "dedup": self._dedup,
+            "index_args": self._vector_index.get_index_args(),
+            "model_name": self._get_model_name(),
+            "n_vectors": len(self._embedded_dict),
+            "pdf_hash": self._pdf_hash,
+            "use_raw_metadata": self._use_raw_metadata,
+        }
+
+    def _get_index_version(self) -> tuple:
+        # lexical rows land after their vectors, so both counts version the results #
+        n_lexical = (
+            0 if self._lexical_index is None else self._lexical_index.get_n_documents()
+        )
+        return self._vector_index.get_version(), n_lexical
+
+    def _get_lexical_mask(self, page_range: tuple) -> np.ndarray:
+        # groups of the indexed documents, extended as the background indexer adds #
+        n_known = len(self._lexical_group_arr)
+        group_list = [
+            self._group_dict[x] for x in self._lexical_index.get_doc_ids(n_known)
+        ]
+        if len(group_list) > 0:
+            self._lexical_group_arr = np.concatenate(
+                [self._lexical_group_arr, np.asarray(group_list, dtype=np.int64)]
+            )
+        return np.isin(self._lexical_group_arr, self._get_groups_in_range(page_range))
+
+    def _get_metadata_key(self) -> str:
+        return "sentence_raw" if self._use_raw_metadata else "sentence_clean"
+
+    def _get_model_name(self) -> str:
+        if hasattr(self._embedder, "get_model_name"):
+            return self._embedder.get_model_name()
+        return type(self._embedder).__name__
+
+    def _get_n_tokens(self, sentence_list: list) -> int:
+        # sentence-transformers models expose the tokenizer they embed with #
+        tokenizer = getattr(self._embedder, "tokenizer", None)
+        if not self._count_tokens or tokenizer is None:
+            return 0
+        token_id_lists = tokenizer(
+            sentence_list,
+            truncation=True,
+            max_length=getattr(self._embedder, "max_seq_length", None),
+        )["input_ids"]
+        return sum(len(x) for x in token_id_lists)
+
+    def _get_occurrence_in_range(self, idx: str, page_range: tuple) -> str:
+        # the group's first occurrence inside the range stands in for it #
+        if page_range is None:
+            return idx
+        for idx_occurrence in self._occurrence_dict.get(idx, [idx]):
+            if page_range[0] <= int(idx_occurrence.split("_")[0]) <= page_range[1]:
+                return idx_occurrence
+        return idx
+
+    def _get_string_cleaner(self) -> StringCleaner:
+        # shared so the word cache built while indexing carries over to queries #
+        if self._string_cleaner is None:
+            self._string_cleaner = StringCleaner(
+                self._char_config["replace"],
+                word_split_char=self._word_split_char,
+                sentence_join_char=self._sentence_join_char,
+            )
+        return self._string_cleaner
+
+    def _get_vector_filters(self, page_range: tuple):
+        if page_range is None:
+            return None
+        # a repeated sentence has one row, it matches if any occurrence is in range #
+        return {"group": self._get_groups_in_range(page_range).tolist()}
+
+    def _index_streaming(self):
+        """
+        Extract, clean, embed and index the pdf in chunks of stream_chunk_pages
+        :return: None
+        """
+        string_cleaner = self._get_string_cleaner()
+        # pages are kept for display, sentence text for the cache sidecar #
+        self._pdf_content_raw = {}
+        self._page_hash_dict = {}
+        self._reset_dedup()
+        # ivf and pq train on their first batch, chunks wait until it is big enough #
+        pending_list = []
+        # quantized indexes may not keep full vectors, the cache needs them exact #
+        keep_embeddings = (
+            self._save_to_cache
+            and not self._vector_index.get_index_args()["store_vectors"]
+        )
+        group_embedding_list = []
+        for page_chunk in self._iter_page_chunks():
+            for idx_page, page_content in page_chunk:
+                self._pdf_content_raw[str(idx_page)] = page_content
+                self._page_hash_dict[str(idx_page)] = hash_string(page_content)
+            sentence_list = list(self._iter_sentences(page_chunk, string_cleaner))
+            # records land before their occurrences, which searches map results to #
+            self._embedded_dict.update(sentence_list)
+            new_idx_set = set(self._dedup_sentences(sentence_list))
+            # sentences repeating an earlier group are only added to its postings #
+            new_sentence_list = [x for x in sentence_list if x[0] in new_idx_set]
+            if len(new_sentence_list) > 0:
+                embedding_arr = self._embed_batched(
+                    [x[1]["sentence_clean"] for x in new_sentence_list],
+                    progress_bar=False,
+                )
+                pending_list.append((embedding_arr, new_sentence_list))
+                if keep_embeddings:
+                    group_embedding_list.append(embedding_arr)
+            n_pending = sum(len(x[0]) for x in pending_list)
+            if n_pending > 0 and n_pending >= self._vector_index.get_n_train_vectors():
+                self._add_chunks_to_vector_db(pending_list)
+                pending_list = []
+        if len(pending_list) > 0:
+            self._add_chunks_to_vector_db(pending_list)
+        if self._save_to_cache and self._vector_index.get_n_vectors() > 0:
+            # groups were added to the index in the order they were first seen #
+            vector_row_dict = {idx: i for i, idx in enumerate(self._occurrence_dict)}
+            group_embedding_arr = (
+                np.concatenate(group_embedding_list)
+                if keep_embeddings
+                else self._vector_index.get_vectors()
+            )
+            self._embedding_arr = group_embedding_arr[
+                [
+                    vector_row_dict[self._canonical_dict[idx]]
+                    for idx in self._embedded_dict
+                ]
+            ]
+            self._write_to_cache()
+            self._save_index()
+
+    def _iter_page_chunks(self):
+        """
+        Yield lists of (page index, page text), stream_chunk_pages pages at a time
+        """
+        n_pages = get_n_pages(self._pdf_filepath)
+        range_list = [
+            (idx_start, min(idx_start + self._stream_chunk_pages, n_pages))
+            for idx_start in range(0, n_pages, self._stream_chunk_pages)
+        ]
+        if self._n_workers <= 1:
+            for idx_start, idx_end in range_list:
+                with self._instrumentation.stage(
+                    "extract", n_items=idx_end - idx_start
+                ):
+                    page_content_list = extract_page_range(
+                        self._pdf_filepath, idx_start, idx_end, self._n_chars_skip
+                    )
+                yield list(enumerate(page_content_list, idx_start))
+            return
+        # bound the chunks in flight so memory does not grow with document size #
+        with ProcessPoolExecutor(max_workers=self._n_workers) as executor:
+            future_queue = deque()
+            for idx_start, idx_end in range_list:
+                future = executor.submit(
+                    extract_page_range,
+                    self._pdf_filepath,
+                    idx_start,
+                    idx_end,
+                    self._n_chars_skip,
+                )
+                future_queue.append((idx_start, future))
+                if len(future_queue) > self._n_workers:
+                    idx_done, future_done = future_queue.popleft()
+                    yield list(enumerate(self._wait_extract(future_done), idx_done))
+            while len(future_queue) > 0:
+                idx_done, future_done = future_queue.popleft()
+                yield list(enumerate(self._wait_extract(future_done), idx_done))
+
+    def _iter_sentences(self, page_iter, string_cleaner: StringCleaner):
+        """
+        Yield (id, sentence dict) for each sentence of each page, with the
+        sentence's character offsets into the stored page text
+        """
+        from nltk.tokenize import sent_tokenize
+
+        for idx_page, page_content in page_iter:
+            with self._instrumentation.stage("tokenize", n_items=1) as stage:
+                page_tokenized = sent_tokenize(page_content[self._n_chars_skip :])
+                stage.add(n_sentences=len(page_tokenized))
+            with self._instrumentation.stage("clean", n_items=len(page_tokenized)):
+                clean_list = [string_cleaner.clean_sentence(x) for x in page_tokenized]
+            offset_list = get_sentence_offsets(
+                page_content, page_tokenized, self._n_chars_skip
+            )
+            yield from make_sentence_records(
+                idx_page, page_tokenized, clean_list, offset_list
+            )
+
+    def _load_saved_index(self) -> bool:
+        """
+        Replace the empty VectorDB with the saved one if it matches the cache
+        :return: True if the saved index was loaded
+        """
+        stamp_filepath = os.path.join(self._index_dirpath, "stamp.json")
+        if not self._load_from_cache or not os.path.exists(stamp_filepath):
+            return False
+        with open(stamp_filepath, "r") as file_reader:
+            index_stamp = json.loads(file_reader.read())
+        if index_stamp != self._get_index_stamp():
+            return False
+        try:
+            with self._instrumentation.stage("index_load"):
+                self._vector_index = VectorDB.load(
+                    self._index_dirpath,
+                    mmap=True,
+                    instrumentation=self._instrumentation,
+                )
+        except (OSError, RuntimeError, ValueError, KeyError):
+            warnings.warn("SAVED INDEX COULD NOT BE LOADED, REBUILDING")
+            return False
+        return True
+
     def _load_vector_db(self, raw_metadata: bool = True):
-        vector_emb = np.asarray([x["embed"] for x in self._embedded_dict.values()])
-        vector_ids = [x for x in self._embedded_dict.keys()]
-        metadata_to_use = "sentence_raw" if raw_metadata else "sentence_clean"
-        vector_raw = [x[metadata_to_use] for x in self._embedded_dict.values()]
-        self._vector_index.add_vectors(
-            vectors=vector_emb, ids=vector_ids, metadata=vector_raw
+        self._add_to_vector_db(
+            self._embedding_arr, self._embedded_dict, raw_metadata=raw_metadata
         )
 
+    def _localize_batch_result(self, result_dict: dict, page_range: tuple):
+        # batch results hold one array per field, see _to_batch_result #
+        for i, idx in enumerate(list(result_dict["ids"])):
+            idx_occurrence = self._get_occurrence_in_range(idx, page_range)
+            if idx_occurrence == idx:
+                continue
+            sentence_dict = self._embedded_dict[idx_occurrence]
+            result_dict["ids"][i] = idx_occurrence
+            for key, value in [
+                ("page", int(idx_occurrence.split("_")[0])),
+                ("char_start", sentence_dict["char_start"]),
+                ("char_end", sentence_dict["char_end"]),
+                ("metadata", sentence_dict[self._get_metadata_key()]),
+            ]:
+                if key in result_dict:
+                    result_dict[key][i] = value
+
+    def _localize_result(self, vector_info: dict, page_range: tuple):
+        idx_occurrence = self._get_occurrence_in_range(vector_info["id"], page_range)
+        if idx_occurrence == vector_info["id"]:
+            return
+        sentence_dict = self._embedded_dict[idx_occurrence]
+        vector_info["id"] = idx_occurrence
+        vector_info["page"] = int(idx_occurrence.split("_")[0])
+        vector_info["char_start"] = sentence_dict["char_start"]
+        vector_info["char_end"] = sentence_dict["char_end"]
+        if "metadata" in vector_info:
+            vector_info["metadata"] = sentence_dict[self._get_metadata_key()]
+
+    def _merge_cached_pages(self) -> list:
+        """
+        Carry over sentences of pages whose content is unchanged since the cache
+        :return: indexes of pages that must be cleaned and embedded
+        """
+        self._page_hash_dict = {
+            idx_page: hash_string(page_content)
+            for idx_page, page_content in self._pdf_content_raw.items()
+        }
+        page_list = list(range(len(self._pdf_content_raw)))
+        if self._cache_dict is None:
+            return page_list
+
+        hash_page_cached = {
+            page_hash: idx_page
+            for idx_page, page_hash in self._cache_manifest["page_hashes"].items()
+        }
+        cached_page_rows = {}
+        for cached_row, idx_cached in enumerate(self._cache_dict["ids"]):
+            idx_page, idx_sentence = idx_cached.split("_")
+            cached_page_rows.setdefault(idx_page, []).append((cached_row, idx_sentence))
+
+        changed_page_list = []
+        for idx_page in page_list:
+            idx_page_cached = hash_page_cached.get(self._page_hash_dict[str(idx_page)])
+            if idx_page_cached is None:
+                changed_page_list.append(idx_page)
+                continue
+            for cached_row, idx_sentence in cached_page_rows.get(idx_page_cached, []):
+                idx_combined = f"{idx_page}_{idx_sentence}"
+                self._embedded_dict[idx_combined] = dict(
+                    self._cache_dict["sentences"][cached_row]
+                )
+                self._cached_row_dict[idx_combined] = cached_row
+        if self._verbose:
+            print(
+                f"Reusing {len(page_list) - len(changed_page_list)}/{len(page_list)}"
+                " pages from cache"
+            )
+        return changed_page_list
+
+    def _progress(self, iterable, **kwargs):
+        if not self._verbose:
+            return iterable
+        from tqdm import tqdm
+
+        return tqdm(iterable, **kwargs)
+
+    def _query_lexical_index(
+        self, string: str, k: int, page_range: tuple = None
+    ) -> tuple:
+        assert self._lexical_index is not None, "LEXICAL INDEX IS DISABLED"
+        with self._instrumentation.stage("lexical_search", n_items=1):
+            query_clean = self._get_string_cleaner().clean_sentence(string)
+            doc_mask = (
+                None if page_range is None else self._get_lexical_mask(page_range)
+            )
+            return self._lexical_index.search(query_clean, k=k, doc_mask=doc_mask)
+
     def _read_char_config(self):
         self._char_config = read_file(self._char_config_filepath)
+        self._string_cleaner = None
 
     def _read_pdf(self, verbose: bool = True):
         if verbose:
             print("Reading PDF")
+        n_pages = get_n_pages(self._pdf_filepath)
+        with self._instrumentation.stage("extract", n_items=n_pages):
+            if self._n_workers > 1 and n_pages >= self._parallel_min_pages:
+                self._read_pdf_parallel(n_pages)
+            else:
+                self._read_pdf_serial()
+
+    def _read_pdf_parallel(self, n_pages: int):
+        # more chunks than workers so uneven pages balance out across the pool #
+        range_list = split_range(n_pages, self._n_workers * 4)
+        with ProcessPoolExecutor(max_workers=self._n_workers) as executor:
+            chunk_iter = executor.map(
+                extract_page_range,
+                [self._pdf_filepath] * len(range_list),
+                [x[0] for x in range_list],
+                [x[1] for x in range_list],
+                [self._n_chars_skip] * len(range_list),
+            )
+            to_iterate = self._progress(chunk_iter, total=len(range_list))
+            page_content_dict = {}
+            for (idx_start, _), page_content_list in zip(range_list, to_iterate):
+                for i, page_content_raw in enumerate(page_content_list):
+                    page_content_dict[str(idx_start + i)] = page_content_raw
+        self._pdf_content_raw = page_content_dict
+
+    def _read_pdf_serial(self):
+        import PyPDF2
+
         pdf_file_obj = open(self._pdf_filepath, "rb")
         pdf_reader = PyPDF2.PdfReader(pdf_file_obj)
-        to_iterate = tqdm(pdf_reader.pages) if self._verbose else pdf_reader.pages
+        to_iterate = self._progress(pdf_reader.pages)
         page_content_dict = {}
         for i, page in enumerate(to_iterate):
             page_content_raw = page.extract_text()
             page_content_dict[str(i)] = page_content_raw[self._n_chars_skip :]
+        pdf_file_obj.close()
         self._pdf_content_raw = page_content_dict
 
+    def _register_groups(self, idx_list: list, canonical_list: list) -> list:
+        """
+        Record the dedup group of each sentence
+        :param idx_list: sentence ids in id order
+        :param canonical_list: canonical id per sentence id
+        :return: ids that start a new group
+        """
+        new_list = []
+        for idx, idx_canonical in zip(idx_list, canonical_list):
+            # groups are registered before any lookup can reach them from a search #
+            if idx == idx_canonical:
+                self._group_dict[idx] = len(self._group_dict)
+                self._occurrence_dict[idx] = [idx]
+                new_list.append(idx)
+            else:
+                self._occurrence_dict[idx_canonical].append(idx)
+            self._canonical_dict[idx] = idx_canonical
+        return new_list
+
+    def _reset_dedup(self):
+        self._canonical_dict = {}
+        self._group_dict = {}
+        self._occurrence_dict = {}
+        self._occurrence_group_arr = np.zeros(0, dtype=np.int64)
+        self._occurrence_page_arr = np.zeros(0, dtype=np.int64)
+        self._sentence_deduplicator = (
+            None
+            if self._dedup == "none"
+            else SentenceDeduplicator(near_duplicates=self._dedup == "near")
+        )
+
+    def _resolve_page_range(self, page_range: tuple, section: str) -> tuple:
+        if section is not None:
+            assert page_range is None, "GIVE PAGE_RANGE OR SECTION, NOT BOTH"
+            section_dict = {x["title"]: x for x in self.get_sections()}
+            assert section in section_dict, f"UNKNOWN SECTION {section}"
+            return (
+                section_dict[section]["page_start"],
+                section_dict[section]["page_end"],
+            )
+        if page_range is None:
+            return None
+        assert len(page_range) == 2, "PAGE_RANGE MUST BE (FIRST, LAST)"
+        return int(page_range[0]), int(page_range[1])
+
+    def _save_index(self):
+        if os.path.exists(self._index_dirpath):
+            shutil.rmtree(self._index_dirpath)
+        with self._instrumentation.stage("index_save"):
+            self._vector_index.save(self._index_dirpath)
+        with open(os.path.join(self._index_dirpath, "stamp.json"), "w") as file_writer:
+            file_writer.write(json.dumps(self._get_index_stamp()))
+
+    def _search_hybrid(
+        self, string: str, k: int, return_metadata: bool, page_range: tuple = None
+    ) -> list:
+        vector_results = self._search_vector(
+            string, max(k, self._hybrid_candidates), False, page_range
+        )
+        return self._fuse_results(
+            string, [x["id"] for x in vector_results], k, return_metadata, page_range
+        )
+
+    def _search_lexical(
+        self, string: str, k: int, return_metadata: bool, page_range: tuple = None
+    ) -> list:
+        lexical_ids, lexical_scores = self._query_lexical_index(string, k, page_range)
+        search_results = self._vector_index.get_items(
+            lexical_ids, return_metadata=return_metadata
+        )
+        for vector_info, lexical_score in zip(search_results, lexical_scores):
+            vector_info["score"] = float(lexical_score)
+        return search_results
+
+    def _search_vector(
+        self, string: str, k: int, return_metadata: bool, page_range: tuple = None
+    ) -> list:
+        filters = self._get_vector_filters(page_range)
+        if self._vector_index.has_embedding_fn():
+            return self._vector_index.get_neighbors(
+                string=string, k=k, return_metadata=return_metadata, filters=filters
+            )
+        embedded_string = self._query_embed_cache.get(string)
+        if embedded_string is None:
+            with self._instrumentation.stage("query_encode", n_items=1):
+                embedded_string = self._embedder.encode(string)
+            self._query_embed_cache.put(string, embedded_string)
+        return self._vector_index.get_neighbors(
+            vector=embedded_string,
+            k=k,
+            return_metadata=return_metadata,
+            filters=filters,
+        )
+
+    def _to_batch_result(self, search_results: list) -> dict:
+        # same layout as VectorDB.get_neighbors_batch, scores in place of distances #
+        result_dict = {
+            "ids": [x["id"] for x in search_results],
+            "scores": np.asarray([x["score"] for x in search_results], np.float32),
+        }
+        if len(search_results) == 0:
+            return result_dict
+        for key in search_results[0].keys():
+            if key == "metadata":
+                result_dict[key] = [x[key] for x in search_results]
+            elif key not in ["id", "score", "vector"]:
+                result_dict[key] = np.asarray([x[key] for x in search_results])
+        return result_dict
+
+    def _wait_extract(self, future) -> list:
+        with self._instrumentation.stage("extract") as stage:
+            page_content_list = future.result()
+            stage.add(n_items=len(page_content_list))
+        return page_content_list
+
     def _write_to_cache(self):
         if len(self._embedded_dict) == 0 or len(self._pdf_content_raw) == 0:
             warnings.warn("NO CONTENTS TO SAVE")
         else:
-            with open(self._cache_filepath, "w") as file_writer:
-                file_writer.write(json.dumps(self._embedded_dict))
-            with open(self._cache_raw_filepath, "w") as file_writer:
-                file_writer.write(json.dumps(self._pdf_content_raw))
+            with self._instrumentation.stage(
+                "cache_write", bytes=int(self._embedding_arr.nbytes)
+            ):
+                self._embedding_cache.write(
+                    ids=list(self._embedded_dict.keys()),
+                    sentences=list(self._embedded_dict.values()),
+                    embeddings=self._embedding_arr,
+                    pages=self._pdf_content_raw,
+                    canonical_ids=[
+                        self._canonical_dict.get(x, x) for x in self._embedded_dict
+                    ],
+                    manifest={
+                        "config_hash": self._get_config_hash(),
+                        "dedup": self._dedup,
+                        "model_name": self._get_model_name(),
+                        "n_dims": int(self._embedding_arr.shape[-1]),
+                        "page_hashes": self._page_hash_dict,
+                        "pdf_hash": self._pdf_hash,
+                    },
+                )
 
-    def config(self):
+    def config(self, stream: bool = False, background: bool = False):
+        """
+        Load or build the embeddings and vector index for the pdf
+        :param stream: on a cache miss, index in bounded chunks of pages
+        :param background: stream on a background thread, chunks are searchable
+            as soon as they are indexed
+        :return: None
+        """
         self._clean_cache_filepath()
-        if not self._check_for_cache():
+        self._read_char_config()
+        self._pdf_hash = hash_file(self._pdf_filepath)
+        cache_valid = self._check_for_cache()
+        self._create_vector_db()
+        if not cache_valid and stream:
+            self._cache_dict = None
+            if background:
+                self._index_thread = threading.Thread(
+                    target=self._index_streaming, daemon=True
+                )
+                self._index_thread.start()
+            else:
+                self._index_streaming()
+            return
+        if not cache_valid:
             self._read_pdf()
-            self._read_char_config()
-            self._clean_and_label_sentences(self._char_config["replace"])
+            changed_page_list = self._merge_cached_pages()
+            self._clean_and_label_sentences(
+                self._char_config["replace"], page_list=changed_page_list
+            )
             self._embed_strings()
-        self._load_vector_db(raw_metadata=self._use_raw_metadata)
+        elif self._cache_dict.get("canonical_ids") is not None and (
+            self._cache_manifest.get("dedup") == self._dedup
+        ):
+            # groups come back from the cache, near mode minhash is not rerun #
+            self._reset_dedup()
+            self._register_groups(
+                list(self._embedded_dict.keys()), self._cache_dict["canonical_ids"]
+            )
+        else:
+            self._reset_dedup()
+            self._dedup_sentences(list(self._embedded_dict.items()))
+        if self._load_saved_index():
+            self._add_to_lexical_index(self._embedded_dict)
+        else:
+            self._load_vector_db(raw_metadata=self._use_raw_metadata)
+            if self._save_to_cache:
+                self._save_index()
 
-    def search(self, string: str, k: int = 10, return_metadata: bool = True):
-        if not self._vector_index.has_embedding_fn():
-            embedded_string = self._embedder.encode(string)
-            search_results = self._vector_index.get_neighbors(
-                vector=embedded_string, k=k, return_metadata=return_metadata
+    def search(
+        self,
+        string: str,
+        k: int = 10,
+        return_metadata: bool = True,
+        mode: str = None,
+        page_range: tuple = None,
+        section: str = None,
+    ):
+        """
+        Find the sentences closest to a query
+        :param string: query text
+        :param k: number of results
+        :param return_metadata: include the stored sentence with each result
+        :param mode: vector, lexical (bm25 only, no model call) or hybrid (both
+            rankings fused), defaults to the search_mode given at construction
+        :param page_range: (first, last) zero based pages, both inclusive, to
+            search within, a repeated sentence is returned as its first
+            occurrence inside the range
+        :param section: title from get_sections to search within, instead of
+            page_range
+        :return: list of result dicts, best first
+        """
+        mode = self._search_mode if mode is None else mode
+        assert mode in SEARCH_MODES, "SEARCH MODE MUST BE ONE OF " + ", ".join(
+            SEARCH_MODES
+        )
+        # results are only valid for the index version they were computed on #
+        index_version = self._get_index_version()
+        if index_version != self._query_cache_version:
+            self._query_result_cache.clear()
+            self._query_cache_version = index_version
+        page_range = self._resolve_page_range(page_range, section)
+        string = normalize_whitespace(string)
+        result_key = (string, k, return_metadata, mode, page_range, index_version)
+        search_results = self._query_result_cache.get(result_key)
+        if search_results is not None:
+            return search_results
+
+        if mode == "lexical":
+            search_results = self._search_lexical(
+                string, k, return_metadata, page_range
+            )
+        elif mode == "hybrid":
+            search_results = self._search_hybrid(string, k, return_metadata, page_range)
+        else:
+            search_results = self._search_vector(string, k, return_metadata, page_range)
+        for vector_info in search_results:
+            self._localize_result(vector_info, page_range)
+            vector_info["occurrences"] = self.get_occurrences(vector_info["id"])
+        self._query_result_cache.put(result_key, search_results)
+        return search_results
+
+    def search_many(
+        self,
+        strings: list,
+        k: int = 10,
+        return_metadata: bool = True,
+        mode: str = None,
+        page_range: tuple = None,
+        section: str = None,
+    ) -> list:
+        mode = self._search_mode if mode is None else mode
+        assert mode in SEARCH_MODES, "SEARCH MODE MUST BE ONE OF " + ", ".join(
+            SEARCH_MODES
+        )
+        page_range = self._resolve_page_range(page_range, section)
+        filters = self._get_vector_filters(page_range)
+        n_vector = max(k, self._hybrid_candidates) if mode == "hybrid" else k
+        if mode == "lexical":
+            search_results = [
+                self._to_batch_result(
+                    self._search_lexical(x, k, return_metadata, page_range)
+                )
+                for x in strings
+            ]
+        elif not self._vector_index.has_embedding_fn():
+            with self._instrumentation.stage("query_encode", n_items=len(strings)):
+                embedded_arr = self._embedder.encode(
+                    list(strings),
+                    batch_size=self._embed_batch_size,
+                    show_progress_bar=False,
+                )
+            search_results = self._vector_index.get_neighbors_batch(
+                vectors=embedded_arr,
+                k=n_vector,
+                return_metadata=return_metadata,
+                filters=filters,
             )
         else:
-            search_results = self._vector_index.get_neighbors(
-                string=string, k=k, return_metadata=return_metadata
+            search_results = self._vector_index.get_neighbors_batch(
+                strings=strings,
+                k=n_vector,
+                return_metadata=return_metadata,
+                filters=filters,
             )
+        if mode == "hybrid":
+            search_results = [
+                self._to_batch_result(
+                    self._fuse_results(
+                        strings[i],
+                        search_results[i]["ids"],
+                        k,
+                        return_metadata,
+                        page_range,
+                    )
+                )
+                for i in range(len(strings))
+            ]
+        for result_dict in search_results:
+            self._localize_batch_result(result_dict, page_range)
+            result_dict["occurrences"] = [
+                self.get_occurrences(x) for x in result_dict["ids"]
+            ]
         return search_results
 
+    def get_embed_stats(self) -> dict:
+        """
+        Embedding throughput so far
+        :return: dict of counts, seconds and per second rates, n_tokens counts
+            model tokens and stays 0 when the embedder has no tokenizer or
+            count_tokens is off
+        """
+        embed_stats = dict(self._embed_stats)
+        seconds = embed_stats["seconds"]
+        for count_name in ["sentences", "tokens", "words"]:
+            embed_stats[f"{count_name}_per_sec"] = (
+                embed_stats[f"n_{count_name}"] / seconds if seconds > 0 else 0.0
+            )
+        return embed_stats
+
+    def get_query_cache_stats(self) -> dict:
+        return {
+            "embedding": self._query_embed_cache.get_stats(),
+            "results": self._query_result_cache.get_stats(),
+        }
+
+    def is_indexing(self) -> bool:
+        return self._index_thread is not None and self._index_thread.is_alive()
+
+    def get_instrumentation(self):
+        return self._instrumentation
+
+    def get_lexical_index(self):
+        return self._lexical_index
+
+    def get_occurrences(self, id: str) -> list:
+        """
+        Every (page, sentence) id whose text was collapsed into the same group
+        :param id: id returned by search
+        :return: ids in page order, starting with the group's first occurrence
+        """
+        return list(self._occurrence_dict.get(self._canonical_dict.get(id, id), [id]))
+
     def get_pdf(self):
         return self._pdf_content_raw
 
+    def get_sections(self) -> list:
+        """
+        Sections from the pdf outline, for section filtered search
+        :return: dicts of title, depth, page_start and page_end, see
+            get_outline_sections
+        """
+        if self._section_list is None:
+            self._section_list = get_outline_sections(self._pdf_filepath)
+        return self._section_list
+
     def get_vector_db(self):
         return self._vector_index
@@ -0,0 +1,101 @@
+import zlib
+import numpy as np
+from typing import List
+
+# mersenne prime, keeps a * x + b inside uint64 for 32 bit shingle hashes #
+_MINHASH_PRIME = (1 << 31) - 1
+
+
+class SentenceDeduplicator:
+    def __init__(
+        self,
+        near_duplicates: bool = False,
+        n_bands: int = 16,
+        n_perm: int = 64,
+        seed: int = 0,
+        shingle_size: int = 3,
+        threshold: float = 0.8,
+    ):
+        """
+        Map each text to the first text seen that is identical or, optionally,
+        a near duplicate by MinHash estimated Jaccard similarity
+        :param near_duplicates: also collapse near duplicates, else exact only
+        :param n_bands: LSH bands, n_perm must be a multiple of it
+        :param n_perm: MinHash permutations
+        :param seed: seed for the permutations
+        :param shingle_size: words per shingle
+        :param threshold: minimum estimated Jaccard similarity to collapse
+        """
+        assert n_perm % n_bands == 0, "N_PERM MUST BE A MULTIPLE OF N_BANDS"
+        self._near_duplicates = near_duplicates
+        self._n_bands = n_bands
+        self._shingle_size = shingle_size
+        self._threshold = threshold
+        rng = np.random.default_rng(seed)
+        self._perm_a = rng.integers(1, _MINHASH_PRIME, n_perm, dtype=np.uint64)
+        self._perm_b = rng.integers(0, _MINHASH_PRIME, n_perm, dtype=np.uint64)
+        self._text_canonical_dict = {}
+        self._band_bucket_dict = {}
+        self._signature_dict = {}
+
+    def _find_near_duplicate(self, signature: np.ndarray):
+        candidate_set = set()
+        for band_key in self._get_band_keys(signature):
+            candidate_set.update(self._band_bucket_dict.get(band_key, []))
+        # candidates share a band, keep the most similar one above threshold #
+        best_id, best_similarity = None, self._threshold
+        for candidate_id in candidate_set:
+            similarity = np.mean(self._signature_dict[candidate_id] == signature)
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate_id, similarity
+        return best_id
+
+    def _get_band_keys(self, signature: np.ndarray) -> list:
+        return [
+            (idx_band, band.tobytes())
+            for idx_band, band in enumerate(np.split(signature, self._n_bands))
+        ]
+
+    def _get_signature(self, text: str) -> np.ndarray:
+        word_list = text.split()
+        n_shingles = max(1, len(word_list) - self._shingle_size + 1)
+        shingle_hashes = np.fromiter(
+            (
+                zlib.crc32(" ".join(word_list[i : i + self._shingle_size]).encode())
+                for i in range(n_shingles)
+            ),
+            dtype=np.uint64,
+            count=n_shingles,
+        )
+        shingle_hashes %= np.uint64(_MINHASH_PRIME)
+        permuted = (
+            self._perm_a[:, None] * shingle_hashes[None, :] + self._perm_b[:, None]
+        ) % np.uint64(_MINHASH_PRIME)
+        return permuted.min(axis=1)
+
+    def add(self, ids: List, texts: List[str]) -> list:
+        """
+        Register texts in order, the first of each group becomes its canonical id
+        :param ids: id per text
+        :param texts: cleaned text per id
+        :return: canonical id per input id, itself if the text is new
+        """
+        assert len(ids) == len(texts), "IDS AND TEXTS MUST BE 1 TO 1"
+        canonical_list = []
+        for text_id, text in zip(ids, texts):
+            canonical_id = self._text_canonical_dict.get(text)
+            if canonical_id is None and self._near_duplicates:
+                signature = self._get_signature(text)
+                canonical_id = self._find_near_duplicate(signature)
+                if canonical_id is None:
+                    self._signature_dict[text_id] = signature
+                    for band_key in self._get_band_keys(signature):
+                        self._band_bucket_dict.setdefault(band_key, []).append(text_id)
+            if canonical_id is None:
+                canonical_id = text_id
+            self._text_canonical_dict.setdefault(text, canonical_id)
+            canonical_list.append(canonical_id)
+        return canonical_list
+
+    def get_n_unique(self) -> int:
+        return len(set(self._text_canonical_dict.values()))
@@ -1,3 +1,4 @@
+import torch
 from sentence_transformers import SentenceTransformer
 
 
@@ -6,9 +7,21 @@ class SGPTEmbedder(SentenceTransformer):
         self,
         model_name_or_path: str = "Muennighoff/SGPT-125M-weightedmean-msmarco-specb-bitfit",
         *args,
+        cpu_mode: bool = False,
+        n_threads: int = None,
         **kwargs
     ):
+        """
+        :param model_name_or_path: SGPT model to load
+        :param cpu_mode: run on cpu with int8 dynamic quantization of the linear
+            layers and inference mode
+        :param n_threads: torch intra-op threads, torch picks when None
+        """
+        if cpu_mode:
+            kwargs["device"] = "cpu"
         super().__init__(model_name_or_path=model_name_or_path, *args, **kwargs)
+        self._model_name_or_path = model_name_or_path
+        self._cpu_mode = cpu_mode
         tokens = ["[SOS]", "{SOS}"]
         self._first_module().tokenizer.add_tokens(tokens, special_tokens=True)
         self._first_module().auto_model.resize_token_embeddings(
@@ -33,6 +46,23 @@ class SGPTEmbedder(SentenceTransformer):
             "}", add_special_tokens=False
         )[0]
         self._first_module().replace_bos = True
+        if cpu_mode:
+            self._optimize_for_cpu(n_threads)
+
+    def _optimize_for_cpu(self, n_threads: int = None):
+        if n_threads is not None:
+            torch.set_num_threads(n_threads)
+        self.eval()
+        # int8 weights with activations quantized per batch, no calibration #
+        self._first_module().auto_model = torch.ao.quantization.quantize_dynamic(
+            self._first_module().auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    def get_model_name(self):
+        # quantized embeddings differ slightly, so they must not share a cache #
+        if self._cpu_mode:
+            return self._model_name_or_path + ":int8"
+        return self._model_name_or_path
 
     def encode(self, sentences, **kwargs):
         is_query = kwargs.pop("is_query", True)
@@ -42,4 +72,7 @@ class SGPTEmbedder(SentenceTransformer):
             if isinstance(sentences, str)
             else [sos_token + sent for sent in sentences]
         )
-        return super().encode(sentences, **kwargs)
+        if not self._cpu_mode:
+            return super().encode(sentences, **kwargs)
+        with torch.inference_mode():
+            return super().encode(sentences, **kwargs)
@@ -0,0 +1,85 @@
+import os
+import numpy as np
+from typing import List
+
+
+class StringTable:
+    def __init__(self):
+        self._buffer = bytearray()
+        self._n_strings = 0
+        self._starts = np.zeros(0, dtype=np.int64)
+        self._ends = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return self._n_strings
+
+    def _reserve(self, n_strings: int):
+        if n_strings <= len(self._starts):
+            return
+        capacity = max(n_strings, 2 * len(self._starts), 16)
+        for attr_name in ["_starts", "_ends"]:
+            arr_new = np.zeros(capacity, dtype=np.int64)
+            arr_new[: self._n_strings] = getattr(self, attr_name)[: self._n_strings]
+            setattr(self, attr_name, arr_new)
+
+    def _make_writable(self):
+        if not isinstance(self._buffer, bytearray):
+            self._buffer = bytearray(self._buffer)
+
+    def append(self, strings: List[str]) -> np.ndarray:
+        """
+        Append strings to the end of the table
+        :param strings: strings to store
+        :return: row index of each appended string
+        """
+        encoded_list = [s.encode("utf-8") for s in strings]
+        lengths = np.fromiter(
+            (len(x) for x in encoded_list), dtype=np.int64, count=len(encoded_list)
+        )
+        ends = len(self._buffer) + np.cumsum(lengths)
+        row_idx = np.arange(self._n_strings, self._n_strings + len(strings))
+        self._reserve(self._n_strings + len(strings))
+        self._starts[row_idx] = ends - lengths
+        self._ends[row_idx] = ends
+        self._make_writable()
+        self._buffer.extend(b"".join(encoded_list))
+        self._n_strings += len(strings)
+        return row_idx
+
+    def get_buffer(self):
+        return self._buffer
+
+    def get(self, idx: int) -> str:
+        return bytes(self._buffer[self._starts[idx] : self._ends[idx]]).decode("utf-8")
+
+    def set(self, idx: int, string: str):
+        # the old bytes are left in the buffer until the table is rebuilt #
+        encoded = string.encode("utf-8")
+        self._make_writable()
+        self._starts[idx] = len(self._buffer)
+        self._buffer.extend(encoded)
+        self._ends[idx] = len(self._buffer)
+
+    def take(self, indices) -> List[str]:
+        return [self.get(i) for i in indices]
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(
+            os.path.join(path, "buffer.npy"),
+            np.frombuffer(self._buffer, dtype=np.uint8),
+        )
+        np.save(os.path.join(path, "starts.npy"), self._starts[: self._n_strings])
+        np.save(os.path.join(path, "ends.npy"), self._ends[: self._n_strings])
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        string_table = cls()
+        # only the byte buffer is mapped, offsets are small and must stay writable #
+        string_table._buffer = np.load(
+            os.path.join(path, "buffer.npy"), mmap_mode="r" if mmap else None
+        )
+        string_table._starts = np.load(os.path.join(path, "starts.npy"))
+        string_table._ends = np.load(os.path.join(path, "ends.npy"))
+        string_table._n_strings = len(string_table._starts)
+        return string_table
@@ -1,51 +1,594 @@
+import json
+import os
+import threading
+import time
 import numpy as np
-import pandas as pd
 import faiss
-from typing import List, Union
+from typing import TYPE_CHECKING, List, Union
+from src.instrumentation import NullInstrumentation
+from src.string_table import StringTable
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# filters matching at most this many vectors are searched exactly in numpy #
+SUBSET_SEARCH_MAX = 4096
 
 
 class VectorDB:
-    def __init__(self, n_dims: int, embedder=None):
+    def __init__(
+        self,
+        n_dims: int,
+        embedder=None,
+        index_type: str = "flat",
+        compact_threshold: float = 0.25,
+        ef_search: int = 64,
+        hnsw_m: int = 32,
+        instrumentation=None,
+        n_lists: int = 1024,
+        nprobe: int = 16,
+        pq_m: int = 64,
+        pq_nbits: int = 8,
+        rerank_factor: int = 1,
+        store_vectors: bool = None,
+        vector_dtype: str = "float32",
+    ):
+        assert index_type in [
+            "flat",
+            "fp16",
+            "sq8",
+            "pq",
+            "ivf_flat",
+            "ivf_pq",
+            "hnsw",
+        ], "INDEX TYPE MUST BE ONE OF flat, fp16, sq8, pq, ivf_flat, ivf_pq, hnsw"
+        assert vector_dtype in [
+            "float32",
+            "float16",
+        ], "VECTOR DTYPE MUST BE float32 OR float16"
+        # quantized codes only need the full vectors alongside them to rerank #
+        if store_vectors is None:
+            store_vectors = rerank_factor > 1 or index_type not in [
+                "sq8",
+                "pq",
+                "ivf_pq",
+            ]
+        assert store_vectors or rerank_factor <= 1, "RERANK NEEDS STORED VECTORS"
         self._n_dims = n_dims
-        self._index = faiss.IndexIDMap(faiss.IndexFlatL2(n_dims))
+        self._index_type = index_type
+        self._compact_threshold = compact_threshold
+        self._rerank_factor = rerank_factor
+        self._store_vectors = store_vectors
+        self._vector_dtype = vector_dtype
+        self._ef_search = ef_search
+        self._hnsw_m = hnsw_m
+        self._n_lists = n_lists
+        self._nprobe = nprobe
+        self._pq_m = pq_m
+        self._pq_nbits = pq_nbits
+        self._instrumentation = (
+            NullInstrumentation() if instrumentation is None else instrumentation
+        )
+        self._index = None
+        self._index_mmap = False
         self._curr_id = 0
         self._index_built = False
+        self._version = 0
+        # faiss indexes are not safe to search while another thread adds #
+        self._lock = threading.Lock()
+        # row i of each array holds internal id i #
+        self._vectors = np.zeros((0, n_dims), dtype=vector_dtype)
+        self._external_ids = np.zeros(0, dtype=object)
+        self._metadata_is_json = np.zeros(0, dtype=bool)
+        # removed rows stay in place until compaction renumbers the rest #
+        self._is_deleted = np.zeros(0, dtype=bool)
+        self._n_deleted = 0
+        self._metadata_table = StringTable()
+        self._attribute_dict = {}
+        self._has_metadata = False
         self._external_internal_id_map = {}
-        self._internal_external_id_map = {}
-        self._id_vector_map = {}
-        self._id_metadata_map = {}
         self._embedder = embedder
+        # last filter resolved, interactive searches tend to repeat it #
+        self._filter_cache = (None, -1, None)
+        self._deleted_selector = (-1, None)
+
+    def _apply_search_params(self):
+        if self._index is None:
+            return
+        if self._index_type in ["ivf_flat", "ivf_pq"]:
+            faiss.extract_index_ivf(self._index.index).nprobe = self._nprobe
+        elif self._index_type == "hnsw":
+            faiss.downcast_index(self._index.index).hnsw.efSearch = self._ef_search
+
+    def _create_index(self, n_train: int):
+        """
+        Build the faiss index, sizing IVF lists from the first batch of vectors
+        :param n_train: number of vectors available to train on
+        :return: None
+        """
+        # faiss wants ~39 training points per list, clamp lists to what is available #
+        n_lists = max(1, min(self._n_lists, n_train // 39))
+        if self._index_type in ["pq", "ivf_pq"]:
+            assert n_train >= 2**self._pq_nbits, "NOT ENOUGH VECTORS TO TRAIN PQ"
+            assert self._n_dims % self._pq_m == 0, "PQ_M MUST DIVIDE N_DIMS"
+        index_factory_dict = {
+            "flat": "Flat",
+            "fp16": "SQfp16",
+            "sq8": "SQ8",
+            "pq": f"PQ{self._pq_m}x{self._pq_nbits}",
+            "ivf_flat": f"IVF{n_lists},Flat",
+            "ivf_pq": f"IVF{n_lists},PQ{self._pq_m}x{self._pq_nbits}",
+            "hnsw": f"HNSW{self._hnsw_m}",
+        }
+        self._index = faiss.IndexIDMap(
+            faiss.index_factory(self._n_dims, index_factory_dict[self._index_type])
+        )
+        self._apply_search_params()
+
+    def _get_filter_ids(self, filters: dict) -> np.ndarray:
+        """
+        Resolve attribute filters to the internal ids they allow
+        :param filters: attribute name to an inclusive (low, high) tuple, either
+            bound may be None, or to a list of allowed values
+        :return: sorted internal ids matching every filter
+        """
+        # ranges and value lists stay distinguishable in the key #
+        filter_key = tuple(
+            (name, condition if isinstance(condition, tuple) else list(condition))
+            for name, condition in sorted(filters.items())
+        )
+        cache_key, cache_version, filter_ids = self._filter_cache
+        # read once, a background add may grow the arrays while this runs #
+        n_vectors, version = self._curr_id, self._version
+        if cache_key == filter_key and cache_version == version:
+            return filter_ids
+        is_allowed = ~self._is_deleted[:n_vectors]
+        for attribute_name, condition in filters.items():
+            assert (
+                attribute_name in self._attribute_dict
+            ), f"UNKNOWN ATTRIBUTE {attribute_name}"
+            attribute_arr = self._attribute_dict[attribute_name][:n_vectors]
+            if isinstance(condition, tuple):
+                assert len(condition) == 2, "RANGE FILTERS MUST BE (LOW, HIGH)"
+                low, high = condition
+                if low is not None:
+                    is_allowed &= attribute_arr >= low
+                if high is not None:
+                    is_allowed &= attribute_arr <= high
+            else:
+                is_allowed &= np.isin(attribute_arr, np.asarray(list(condition)))
+        filter_ids = np.flatnonzero(is_allowed).astype(np.int64)
+        self._filter_cache = (filter_key, version, filter_ids)
+        return filter_ids
+
+    def _get_metadata(self, internal_ids) -> list:
+        return [
+            (
+                json.loads(self._metadata_table.get(x))
+                if self._metadata_is_json[x]
+                else self._metadata_table.get(x)
+            )
+            for x in internal_ids
+        ]
+
+    def _get_search_params(self, filter_ids: np.ndarray = None):
+        if filter_ids is None:
+            # removed ids left in the index are skipped until compaction #
+            selector_version, id_selector = self._deleted_selector
+            if selector_version != self._version:
+                deleted_selector = faiss.IDSelectorBatch(
+                    np.flatnonzero(self._is_deleted[: self._curr_id])
+                )
+                id_selector = faiss.IDSelectorNot(deleted_selector)
+                id_selector.referenced_objects = [deleted_selector]
+                self._deleted_selector = (self._version, id_selector)
+        elif filter_ids[-1] - filter_ids[0] + 1 == len(filter_ids):
+            # page ranges map to contiguous ids, a range check beats a hash lookup #
+            id_selector = faiss.IDSelectorRange(
+                int(filter_ids[0]), int(filter_ids[-1]) + 1
+            )
+        else:
+            id_selector = faiss.IDSelectorBatch(filter_ids)
+        if self._index_type in ["ivf_flat", "ivf_pq"]:
+            return faiss.SearchParametersIVF(sel=id_selector, nprobe=self._nprobe)
+        if self._index_type == "hnsw":
+            return faiss.SearchParametersHNSW(sel=id_selector, efSearch=self._ef_search)
+        return faiss.SearchParameters(sel=id_selector)
+
+    def _get_stored_vectors(self, internal_ids: np.ndarray) -> np.ndarray:
+        """
+        Vectors of internal ids, decoded from the index when they are not stored
+        :param internal_ids: internal ids to fetch
+        :return: one row per id, lossy for quantized types when decoded, zero
+            for removed rows no longer in the index
+        """
+        internal_ids = np.asarray(internal_ids, dtype=np.int64)
+        if self._store_vectors:
+            return self._vectors[internal_ids]
+        # ids are added in order, a removal from flat codes closes the gap #
+        positions = internal_ids
+        is_removed = np.zeros(len(internal_ids), dtype=bool)
+        if self._removes_from_index() and self._n_deleted > 0:
+            is_deleted = self._is_deleted[: self._curr_id]
+            positions = internal_ids - np.cumsum(is_deleted)[internal_ids]
+            is_removed = is_deleted[internal_ids]
+        positions = np.where(is_removed, 0, positions)
+        with self._lock:
+            if self._index_type in ["ivf_flat", "ivf_pq"]:
+                index_ivf = faiss.extract_index_ivf(self._index.index)
+                if index_ivf.direct_map.no():
+                    index_ivf.make_direct_map()
+            vectors = self._index.index.reconstruct_batch(positions)
+        vectors[is_removed] = 0
+        return vectors.astype(self._vector_dtype, copy=False)
+
+    def _has_deleted_in_index(self) -> bool:
+        return self._n_deleted > 0 and not self._removes_from_index()
+
+    def _make_index_writable(self):
+        if not self._index_mmap:
+            return
+        if self._index_type in ["ivf_flat", "ivf_pq"]:
+            # mapped ivf lists cannot be serialized, copy them into memory first #
+            index_ivf = faiss.extract_index_ivf(self._index.index)
+            invlists = faiss.ArrayInvertedLists(index_ivf.nlist, index_ivf.code_size)
+            for idx_list in range(index_ivf.nlist):
+                list_size = index_ivf.invlists.list_size(idx_list)
+                if list_size > 0:
+                    invlists.add_entries(
+                        idx_list,
+                        list_size,
+                        index_ivf.invlists.get_ids(idx_list),
+                        index_ivf.invlists.get_codes(idx_list),
+                    )
+            index_ivf.replace_invlists(invlists, True)
+            invlists.this.disown()
+        # copy a memory-mapped index into memory before modifying it #
+        self._index = faiss.deserialize_index(faiss.serialize_index(self._index))
+        self._apply_search_params()
+        self._index_mmap = False
+
+    def _removes_from_index(self) -> bool:
+        # IndexIDMap renumbers after a removal as flat storage does, which
+        # corrupts its id map for ivf, and hnsw cannot remove at all #
+        return self._index_type in ["flat", "fp16", "sq8", "pq"]
+
+    def _renumber_ivf(self, keep_ids: np.ndarray):
+        """
+        Drop removed rows from an ivf index and renumber the rest in place,
+        keeping the codes, as decoded ivf_pq vectors may encode to another list
+        :param keep_ids: sorted internal ids that stay, renumbered to their rank
+        :return: None
+        """
+        index_ivf = faiss.extract_index_ivf(self._index.index)
+        index_ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+        index_ivf.remove_ids(
+            faiss.IDSelectorBatch(np.flatnonzero(self._is_deleted[: self._curr_id]))
+        )
+        for list_no in range(index_ivf.nlist):
+            list_size = index_ivf.invlists.list_size(list_no)
+            if list_size == 0:
+                continue
+            list_ids = faiss.rev_swig_ptr(
+                index_ivf.invlists.get_ids(list_no), list_size
+            )
+            list_ids[:] = np.searchsorted(keep_ids, list_ids)
+        faiss.copy_array_to_vector(
+            np.arange(len(keep_ids), dtype=np.int64), self._index.id_map
+        )
+        self._index.ntotal = len(keep_ids)
+
+    def _rerank(self, vectors: np.ndarray, candidate_ids: np.ndarray, k: int):
+        """
+        Re-order approximate candidates by exact L2 distance to the stored vectors
+        :param vectors: float32 queries, one row per query
+        :param candidate_ids: internal ids from the index, -1 where missing
+        :param k: number of neighbors to keep per query
+        :return: distances and internal ids, both of shape (n_queries, k)
+        """
+        distance_list, id_list = [], []
+        # chunk queries so the gathered candidate block stays small #
+        for idx_start in range(0, len(vectors), 256):
+            query_chunk = vectors[idx_start : idx_start + 256]
+            id_chunk = candidate_ids[idx_start : idx_start + 256]
+            candidate_vectors = self._vectors[np.maximum(id_chunk, 0)].astype(
+                np.float32
+            )
+            distances = np.sum(
+                (candidate_vectors - query_chunk[:, None, :]) ** 2, axis=-1
+            )
+            distances[id_chunk < 0] = np.inf
+            order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+            distance_list.append(np.take_along_axis(distances, order, axis=1))
+            id_list.append(np.take_along_axis(id_chunk, order, axis=1))
+        return np.concatenate(distance_list), np.concatenate(id_list)
+
+    def _reserve(self, n_vectors: int):
+        if n_vectors <= len(self._external_ids) and (
+            not self._store_vectors or self._vectors.flags.writeable
+        ):
+            return
+        capacity = max(n_vectors, 2 * len(self._external_ids), 16)
+        if self._store_vectors:
+            vectors_new = np.zeros((capacity, self._n_dims), dtype=self._vector_dtype)
+            vectors_new[: self._curr_id] = self._vectors[: self._curr_id]
+            self._vectors = vectors_new
+        external_ids_new = np.empty(capacity, dtype=object)
+        external_ids_new[: self._curr_id] = self._external_ids[: self._curr_id]
+        is_json_new = np.zeros(capacity, dtype=bool)
+        is_json_new[: self._curr_id] = self._metadata_is_json[: self._curr_id]
+        is_deleted_new = np.zeros(capacity, dtype=bool)
+        is_deleted_new[: self._curr_id] = self._is_deleted[: self._curr_id]
+        for attribute_name, attribute_arr in self._attribute_dict.items():
+            attribute_new = np.full(capacity, -1, dtype=np.int64)
+            attribute_new[: self._curr_id] = attribute_arr[: self._curr_id]
+            self._attribute_dict[attribute_name] = attribute_new
+        self._external_ids = external_ids_new
+        self._metadata_is_json = is_json_new
+        self._is_deleted = is_deleted_new
+
+    def _search(self, vectors: np.ndarray, k: int, filter_ids: np.ndarray = None):
+        """
+        Search the index, optionally only among some internal ids
+        :param vectors: float32 queries, one row per query
+        :param k: number of neighbors per query
+        :param filter_ids: sorted internal ids allowed in the results
+        :return: distances and internal ids, both of shape (n_queries, k), ids
+            are -1 where fewer than k neighbors were found
+        """
+        # without stored vectors only pq, which has no other way, decodes the subset #
+        # an empty filter returns no neighbors from the subset path for every type #
+        if filter_ids is not None and (
+            len(filter_ids) == 0
+            or (len(filter_ids) <= SUBSET_SEARCH_MAX and self._store_vectors)
+            or self._index_type == "pq"
+        ):
+            return self._search_subset(vectors, k, filter_ids)
+        n_candidates = k * self._rerank_factor if self._rerank_factor > 1 else k
+        with self._instrumentation.stage("index_search", n_items=len(vectors)):
+            search_params = (
+                self._get_search_params(filter_ids)
+                if filter_ids is not None or self._has_deleted_in_index()
+                else None
+            )
+            with self._lock:
+                distances, internal_vector_ids = self._index.search(
+                    vectors, k=n_candidates, params=search_params
+                )
+            if n_candidates > k:
+                distances, internal_vector_ids = self._rerank(
+                    vectors, internal_vector_ids, k
+                )
+        return distances, internal_vector_ids
+
+    def _search_subset(self, vectors: np.ndarray, k: int, filter_ids: np.ndarray):
+        # small filters and plain pq, which takes no id selector, are scanned exactly #
+        with self._instrumentation.stage("index_search", n_items=len(vectors)):
+            distances = np.full((len(vectors), k), np.inf, dtype=np.float32)
+            internal_vector_ids = np.full((len(vectors), k), -1, dtype=np.int64)
+            if len(filter_ids) == 0:
+                return distances, internal_vector_ids
+            if not self._store_vectors:
+                subset_vectors = self._get_stored_vectors(filter_ids)
+            elif filter_ids[-1] - filter_ids[0] + 1 == len(filter_ids):
+                subset_vectors = self._vectors[filter_ids[0] : filter_ids[-1] + 1]
+            else:
+                subset_vectors = self._vectors[filter_ids]
+            subset_vectors = np.ascontiguousarray(subset_vectors, dtype=np.float32)
+            n_found = min(k, len(filter_ids))
+            subset_distances, subset_rows = faiss.knn(vectors, subset_vectors, n_found)
+            distances[:, :n_found] = subset_distances
+            internal_vector_ids[:, :n_found] = filter_ids[subset_rows]
+        return distances, internal_vector_ids
+
+    def _set_attributes(self, id_arr: np.ndarray, attributes: dict):
+        # rows without a value for an attribute hold -1 #
+        for attribute_name, attribute_values in attributes.items():
+            assert len(attribute_values) == len(
+                id_arr
+            ), "ATTRIBUTES AND VECTORS MUST BE 1 TO 1"
+            if attribute_name not in self._attribute_dict:
+                self._attribute_dict[attribute_name] = np.full(
+                    len(self._external_ids), -1, dtype=np.int64
+                )
+            self._attribute_dict[attribute_name][id_arr] = attribute_values
 
     def add_vectors(
         self,
         vectors: np.ndarray,
-        ids: Union[List, np.ndarray, pd.Series] = None,
+        ids: Union[List, np.ndarray, "pd.Series"] = None,
         metadata: List[Union[dict, str, tuple]] = None,
+        attributes: dict = None,
     ):
+        """
+        Add vectors with optional external ids, metadata and integer attributes
+        :param vectors: one row per vector
+        :param ids: external id per vector
+        :param metadata: str, dict or tuple per vector
+        :param attributes: attribute name to one integer per vector
+        :return: None
+        """
         if ids is not None:
             assert len(vectors) == len(ids), "IDS AND VECTORS MUST BE 1 TO 1"
         if metadata is not None:
             assert len(vectors) == len(metadata), "METADATA AND VECTORS MUST BE 1 TO 1"
+        with self._instrumentation.stage(
+            "index_add", n_items=len(vectors), bytes=int(np.asarray(vectors).nbytes)
+        ):
+            if self._index is None:
+                self._create_index(n_train=len(vectors))
+            self._make_index_writable()
+            if not self._index.is_trained:
+                self._index.train(np.ascontiguousarray(vectors, dtype=np.float32))
 
-        id_list = []
-        for i in range(len(vectors)):
-            vector = vectors[i, :]
-            id_internal = self._curr_id
-            id_list.append(id_internal)
-            self._id_vector_map[id_internal] = vector
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            n_new = len(vectors)
+            id_arr = np.arange(self._curr_id, self._curr_id + n_new, dtype=np.int64)
+            vectors_stored = (
+                vectors
+                if self._vector_dtype == "float32"
+                else vectors.astype(self._vector_dtype)
+            )
+            if self._curr_id == 0:
+                # adopt the first batch as storage, keeps memory-mapped input unread #
+                if self._store_vectors:
+                    self._vectors = vectors_stored
+                self._external_ids = np.empty(n_new, dtype=object)
+                self._metadata_is_json = np.zeros(n_new, dtype=bool)
+                self._is_deleted = np.zeros(n_new, dtype=bool)
+                self._attribute_dict = {}
+            else:
+                self._reserve(self._curr_id + n_new)
+                if self._store_vectors:
+                    self._vectors[id_arr] = vectors_stored
+            self._set_attributes(id_arr, {} if attributes is None else attributes)
             if ids is not None:
-                self._external_internal_id_map[ids[i]] = id_internal
-                self._internal_external_id_map[id_internal] = ids[i]
+                id_list = list(ids)
+                self._external_ids[id_arr] = id_list
+                self._external_internal_id_map.update(zip(id_list, id_arr.tolist()))
             if metadata is not None:
-                self._id_metadata_map[id_internal] = metadata[i]
-            self._curr_id += 1
-        self._index.add_with_ids(vectors, np.asarray(id_list).astype(np.int64))
+                self._has_metadata = True
+                is_json = np.asarray([not isinstance(x, str) for x in metadata], bool)
+                self._metadata_is_json[id_arr] = is_json
+                metadata = [
+                    json.dumps(x) if is_json[i] else x for i, x in enumerate(metadata)
+                ]
+            self._metadata_table.append([""] * n_new if metadata is None else metadata)
+            self._curr_id += n_new
+            with self._lock:
+                self._index.add_with_ids(vectors, id_arr)
         self._index_built = True
+        self._version += 1
+
+    def remove(self, ids: List):
+        """
+        Remove vectors by external id, compacting once removed rows pass
+        compact_threshold of the total, not safe while another thread searches
+        :param ids: external ids to remove, KeyError if any is unknown
+        :return: None
+        """
+        internal_id_arr = np.unique(
+            np.asarray([self._external_internal_id_map[x] for x in ids], dtype=np.int64)
+        )
+        if len(internal_id_arr) == 0:
+            return
+        with self._instrumentation.stage("index_remove", n_items=len(internal_id_arr)):
+            if self._removes_from_index():
+                self._make_index_writable()
+                with self._lock:
+                    self._index.remove_ids(faiss.IDSelectorBatch(internal_id_arr))
+            for external_id in self._external_ids[internal_id_arr]:
+                del self._external_internal_id_map[external_id]
+            self._is_deleted[internal_id_arr] = True
+            self._external_ids[internal_id_arr] = None
+            self._n_deleted += len(internal_id_arr)
+        self._version += 1
+        if self._n_deleted > self._compact_threshold * self._curr_id:
+            self.compact()
+
+    def upsert(
+        self,
+        vectors: np.ndarray,
+        ids: Union[List, np.ndarray, "pd.Series"],
+        metadata: List[Union[dict, str, tuple]] = None,
+        attributes: dict = None,
+    ):
+        """
+        Replace the vectors of ids already stored and add the rest, see
+        add_vectors, not safe while another thread searches
+        :param vectors: one row per vector
+        :param ids: unique external id per vector
+        :param metadata: str, dict or tuple per vector
+        :param attributes: attribute name to one integer per vector
+        :return: None
+        """
+        id_list = list(ids)
+        assert len(set(id_list)) == len(id_list), "UPSERT IDS MUST BE UNIQUE"
+        self.remove([x for x in id_list if x in self._external_internal_id_map])
+        self.add_vectors(vectors, ids=id_list, metadata=metadata, attributes=attributes)
+
+    def compact(self) -> int:
+        """
+        Drop removed rows from storage and rebuild the faiss index from the rest,
+        renumbers internal ids, not safe while another thread searches
+        :return: number of rows dropped
+        """
+        n_deleted = self._n_deleted
+        if n_deleted == 0:
+            return 0
+        keep_ids = np.flatnonzero(~self._is_deleted[: self._curr_id])
+        with self._instrumentation.stage("index_compact", n_items=len(keep_ids)):
+            self._make_index_writable()
+            # fancy indexing copies, so memory-mapped storage becomes writable #
+            is_ivf_codes = not self._store_vectors and self._index_type in [
+                "ivf_flat",
+                "ivf_pq",
+            ]
+            if is_ivf_codes:
+                with self._lock:
+                    self._renumber_ivf(keep_ids)
+            else:
+                # decoded sq8 and pq vectors encode back to the codes they came from #
+                vectors_keep = self._get_stored_vectors(keep_ids)
+            if self._store_vectors:
+                self._vectors = vectors_keep
+            self._external_ids = self._external_ids[keep_ids]
+            self._metadata_is_json = self._metadata_is_json[keep_ids]
+            self._is_deleted = np.zeros(len(keep_ids), dtype=bool)
+            metadata_table = StringTable()
+            metadata_table.append(self._metadata_table.take(keep_ids))
+            self._metadata_table = metadata_table
+            self._attribute_dict = {
+                attribute_name: attribute_arr[keep_ids]
+                for attribute_name, attribute_arr in self._attribute_dict.items()
+            }
+            self._external_internal_id_map = {
+                x: i for i, x in enumerate(self._external_ids.tolist()) if x is not None
+            }
+            self._curr_id = len(keep_ids)
+            self._n_deleted = 0
+            if not is_ivf_codes:
+                # reset keeps ivf and pq training, only the stored codes are rebuilt #
+                with self._lock:
+                    self._index.reset()
+                    self._index.add_with_ids(
+                        np.ascontiguousarray(vectors_keep, dtype=np.float32),
+                        np.arange(self._curr_id, dtype=np.int64),
+                    )
+        self._version += 1
+        return n_deleted
 
     def get_vector(self, id):
         assert self._index_built, "INDEX MUST CONTAIN VECTORS BEFORE ACCESS"
         internal_id = self._external_internal_id_map[id]
-        return self._id_vector_map[internal_id]
+        return self._get_stored_vectors([internal_id])[0]
+
+    def get_items(self, ids: List, return_metadata: bool = False) -> List[dict]:
+        """
+        Look up stored entries by external id, formatted like get_neighbors
+        without distances
+        :param ids: external ids to fetch
+        :param return_metadata: include metadata for each entry
+        :return: one dict per id, in the order given
+        """
+        if len(ids) == 0:
+            return []
+        internal_id_arr = np.asarray(
+            [self._external_internal_id_map[x] for x in ids], dtype=np.int64
+        )
+        if return_metadata:
+            assert self._has_metadata, "NO METADATA PROVIDED"
+            metadata_list = self._get_metadata(internal_id_arr)
+        vector_arr = self._get_stored_vectors(internal_id_arr)
+        vector_info_list = []
+        for i, internal_id in enumerate(internal_id_arr):
+            vector_info = {"id": ids[i], "vector": vector_arr[i]}
+            if return_metadata:
+                vector_info["metadata"] = metadata_list[i]
+            for attribute_name, attribute_arr in self._attribute_dict.items():
+                vector_info[attribute_name] = int(attribute_arr[internal_id])
+            vector_info_list.append(vector_info)
+        return vector_info_list
 
     def get_neighbors(
         self,
@@ -54,27 +597,57 @@ class VectorDB:
         id=None,
         k: int = 10,
         return_metadata: bool = False,
+        filters: dict = None,
     ):
+        """
+        Find the nearest stored vectors to a string, vector or stored id
+        :param string: query string, encoded with the embedder
+        :param vector: query vector
+        :param id: external id of a stored vector to query with
+        :param k: number of neighbors
+        :param return_metadata: include metadata for each neighbor
+        :param filters: attribute name to an inclusive (low, high) tuple or a
+            list of allowed values, only matching vectors are searched
+        :return: one dict per neighbor, nearest first
+        """
         assert (
             (string is not None) or (vector is not None) or (id is not None)
         ), "MUST PROVIDE VECTOR OR VECTOR_ID"
+        # a streaming build can be searched before its first chunk lands #
+        if not self._index_built:
+            return []
         if string is not None:
             assert self._embedder is not None, "MUST PROVIDE AN EMBEDDER"
-            vector = self._embedder.encode(string)
+            with self._instrumentation.stage("query_encode", n_items=1):
+                vector = self._embedder.encode(string)
         if vector is None:
             internal_id = self._external_internal_id_map[id]
-            vector = self._id_vector_map[internal_id]
+            vector = self._get_stored_vectors([internal_id])[0]
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
         vector = np.expand_dims(vector, axis=0) if len(vector.shape) == 1 else vector
-        distances, internal_vector_ids = self._index.search(vector, k=k)
+        filter_ids = None if filters is None else self._get_filter_ids(filters)
+        distances, internal_vector_ids = self._search(
+            vector, k=k, filter_ids=filter_ids
+        )
         distances, internal_vector_ids = (
             distances.flatten(),
             internal_vector_ids.flatten(),
         )
-        vector_ids = [self._internal_external_id_map[id] for id in internal_vector_ids]
-        matching_vectors = [self._id_vector_map[id] for id in internal_vector_ids]
+        # approximate indexes pad with -1 when fewer than k neighbors are found #
+        is_found = internal_vector_ids >= 0
+        distances, internal_vector_ids = (
+            distances[is_found],
+            internal_vector_ids[is_found],
+        )
+        vector_ids = self._external_ids[internal_vector_ids].tolist()
+        matching_vectors = self._get_stored_vectors(internal_vector_ids)
+        attribute_values = {
+            attribute_name: attribute_arr[internal_vector_ids].tolist()
+            for attribute_name, attribute_arr in self._attribute_dict.items()
+        }
         if return_metadata:
-            assert len(self._id_metadata_map) > 0, "NO METADATA PROVIDED"
-            metadata_list = [self._id_metadata_map[id] for id in internal_vector_ids]
+            assert self._has_metadata, "NO METADATA PROVIDED"
+            metadata_list = self._get_metadata(internal_vector_ids)
         vector_info_list = []
         for i in range(len(matching_vectors)):
             vector_info = {
@@ -84,13 +657,293 @@ class VectorDB:
             }
             if return_metadata:
                 vector_info.update({"metadata": metadata_list[i]})
+            for attribute_name, attribute_list in attribute_values.items():
+                vector_info[attribute_name] = attribute_list[i]
             vector_info_list.append(vector_info)
         return vector_info_list
 
+    def get_neighbors_batch(
+        self,
+        strings: List[str] = None,
+        vectors: np.ndarray = None,
+        k: int = 10,
+        return_metadata: bool = False,
+        filters: dict = None,
+    ) -> List[dict]:
+        """
+        Search many queries with a single faiss call
+        :param strings: query strings, encoded in one call to the embedder
+        :param vectors: query vectors, one row per query
+        :param k: number of neighbors per query
+        :param return_metadata: include metadata for each neighbor
+        :param filters: applied to every query, see get_neighbors
+        :return: one dict of ids, distances (and metadata) per query
+        """
+        assert (strings is not None) or (vectors is not None), "MUST PROVIDE VECTORS"
+        if not self._index_built:
+            n_queries = (
+                len(strings) if strings is not None else len(np.atleast_2d(vectors))
+            )
+            empty_dict = {"ids": [], "distances": np.zeros(0, dtype=np.float32)}
+            if return_metadata:
+                empty_dict["metadata"] = []
+            return [dict(empty_dict) for _ in range(n_queries)]
+        if strings is not None:
+            assert self._embedder is not None, "MUST PROVIDE AN EMBEDDER"
+            with self._instrumentation.stage("query_encode", n_items=len(strings)):
+                vectors = self._embedder.encode(list(strings))
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        vectors = np.expand_dims(vectors, axis=0) if vectors.ndim == 1 else vectors
+        if return_metadata:
+            assert self._has_metadata, "NO METADATA PROVIDED"
+        filter_ids = None if filters is None else self._get_filter_ids(filters)
+        distances, internal_vector_ids = self._search(
+            vectors, k=k, filter_ids=filter_ids
+        )
+        result_list = []
+        for i in range(len(vectors)):
+            is_found = internal_vector_ids[i] >= 0
+            internal_id_arr = internal_vector_ids[i][is_found]
+            result_dict = {
+                "ids": self._external_ids[internal_id_arr].tolist(),
+                "distances": distances[i][is_found],
+            }
+            if return_metadata:
+                result_dict["metadata"] = self._get_metadata(internal_id_arr)
+            for attribute_name, attribute_arr in self._attribute_dict.items():
+                result_dict[attribute_name] = attribute_arr[internal_id_arr]
+            result_list.append(result_dict)
+        return result_list
+
     def add_metadata(self, ids, metadata: List[str]):
         for i in range(len(ids)):
             internal_id = self._external_internal_id_map[ids[i]]
-            self._id_metadata_map[internal_id] = metadata[i]
+            is_json = not isinstance(metadata[i], str)
+            self._metadata_is_json[internal_id] = is_json
+            self._metadata_table.set(
+                internal_id, json.dumps(metadata[i]) if is_json else metadata[i]
+            )
+        self._has_metadata = True
+        self._version += 1
+
+    def get_attribute(self, attribute_name: str) -> np.ndarray:
+        return self._attribute_dict[attribute_name][: self._curr_id]
+
+    def get_index_args(self) -> dict:
+        return {
+            "index_type": self._index_type,
+            "compact_threshold": self._compact_threshold,
+            "ef_search": self._ef_search,
+            "hnsw_m": self._hnsw_m,
+            "n_lists": self._n_lists,
+            "nprobe": self._nprobe,
+            "pq_m": self._pq_m,
+            "pq_nbits": self._pq_nbits,
+            "rerank_factor": self._rerank_factor,
+            "store_vectors": self._store_vectors,
+            "vector_dtype": self._vector_dtype,
+        }
+
+    def get_instrumentation(self):
+        return self._instrumentation
+
+    def get_memory_usage(self) -> dict:
+        index_bytes = (
+            0 if self._index is None else len(faiss.serialize_index(self._index))
+        )
+        return {
+            "index_bytes": index_bytes,
+            "vector_bytes": self._vectors[: self._curr_id].nbytes,
+            "metadata_bytes": len(self._metadata_table.get_buffer()),
+        }
+
+    def get_n_train_vectors(self) -> int:
+        """
+        Vectors the first add_vectors call needs to train the index as configured
+        :return: 0 once the index exists, else the training set size wanted
+        """
+        if self._index is not None:
+            return 0
+        n_train_dict = {
+            "pq": 2**self._pq_nbits,
+            "ivf_flat": 39 * self._n_lists,
+            "ivf_pq": max(39 * self._n_lists, 2**self._pq_nbits),
+        }
+        return n_train_dict.get(self._index_type, 1)
+
+    def get_n_deleted(self) -> int:
+        return self._n_deleted
+
+    def get_n_vectors(self):
+        return self._curr_id - self._n_deleted
+
+    def get_n_dims(self):
+        return self._n_dims
+
+    def get_vectors(self):
+        if not self._store_vectors:
+            return self._get_stored_vectors(np.arange(self._curr_id))
+        return self._vectors[: self._curr_id]
+
+    def get_version(self):
+        return self._version
 
     def has_embedding_fn(self):
         return self._embedder is not None
+
+    def save(self, path: str):
+        """
+        Write the faiss index, vectors, ids and metadata to a directory
+        :param path: directory to write to
+        :return: None
+        """
+        assert self._index_built, "INDEX MUST CONTAIN VECTORS BEFORE SAVING"
+        os.makedirs(path, exist_ok=True)
+        # mapped ivf lists are dropped by write_index #
+        self._make_index_writable()
+        faiss.write_index(self._index, os.path.join(path, "index.faiss"))
+        if self._store_vectors:
+            np.save(os.path.join(path, "vectors.npy"), self._vectors[: self._curr_id])
+        np.save(
+            os.path.join(path, "metadata_is_json.npy"),
+            self._metadata_is_json[: self._curr_id],
+        )
+        np.save(os.path.join(path, "is_deleted.npy"), self._is_deleted[: self._curr_id])
+        self._metadata_table.save(os.path.join(path, "metadata"))
+        for attribute_name, attribute_arr in self._attribute_dict.items():
+            np.save(
+                os.path.join(path, f"attribute_{attribute_name}.npy"),
+                attribute_arr[: self._curr_id],
+            )
+        with open(os.path.join(path, "ids.json"), "w") as file_writer:
+            file_writer.write(json.dumps(self._external_ids[: self._curr_id].tolist()))
+        # config written last so a partial save never looks loadable #
+        config_dict = {
+            "n_dims": self._n_dims,
+            "n_vectors": self._curr_id,
+            "n_deleted": self._n_deleted,
+            "has_metadata": self._has_metadata,
+            "attribute_names": list(self._attribute_dict.keys()),
+            "index_args": self.get_index_args(),
+        }
+        with open(os.path.join(path, "config.json"), "w") as file_writer:
+            file_writer.write(json.dumps(config_dict))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, embedder=None, instrumentation=None):
+        """
+        Load a VectorDB written by save
+        :param path: directory written by save
+        :param mmap: memory-map the index, vectors and metadata read-only
+        :param embedder: embedder used for string queries
+        :param instrumentation: receives stage timings, see src.instrumentation
+        :return: VectorDB
+        """
+        with open(os.path.join(path, "config.json"), "r") as file_reader:
+            config_dict = json.loads(file_reader.read())
+        vector_db = cls(
+            config_dict["n_dims"],
+            embedder=embedder,
+            instrumentation=instrumentation,
+            **config_dict["index_args"],
+        )
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        vector_db._index = faiss.read_index(os.path.join(path, "index.faiss"), io_flags)
+        vector_db._index_mmap = mmap
+        vector_db._apply_search_params()
+        if vector_db._store_vectors:
+            vector_db._vectors = np.load(
+                os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None
+            )
+        vector_db._metadata_is_json = np.load(
+            os.path.join(path, "metadata_is_json.npy")
+        )
+        # indexes saved before removal was supported have no tombstones #
+        is_deleted_filepath = os.path.join(path, "is_deleted.npy")
+        vector_db._is_deleted = (
+            np.load(is_deleted_filepath)
+            if os.path.exists(is_deleted_filepath)
+            else np.zeros(config_dict["n_vectors"], dtype=bool)
+        )
+        vector_db._n_deleted = config_dict.get("n_deleted", 0)
+        vector_db._metadata_table = StringTable.load(
+            os.path.join(path, "metadata"), mmap=mmap
+        )
+        vector_db._attribute_dict = {
+            attribute_name: np.load(
+                os.path.join(path, f"attribute_{attribute_name}.npy")
+            )
+            for attribute_name in config_dict["attribute_names"]
+        }
+        with open(os.path.join(path, "ids.json"), "r") as file_reader:
+            id_list = json.loads(file_reader.read())
+        vector_db._external_ids = np.empty(len(id_list), dtype=object)
+        vector_db._external_ids[:] = id_list
+        vector_db._external_internal_id_map = {
+            x: i for i, x in enumerate(id_list) if x is not None
+        }
+        vector_db._curr_id = config_dict["n_vectors"]
+        vector_db._has_metadata = config_dict["has_metadata"]
+        vector_db._index_built = vector_db._curr_id > 0
+        return vector_db
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        self._nprobe = self._nprobe if nprobe is None else nprobe
+        self._ef_search = self._ef_search if ef_search is None else ef_search
+        self._apply_search_params()
+
+
+def compare_index_recall(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    index_args_list: List[dict],
+    k: int = 10,
+) -> "pd.DataFrame":
+    """
+    Compare recall@k, search latency and memory of index settings against the
+    flat index
+    :param vectors: vectors to index
+    :param queries: query vectors
+    :param index_args_list: VectorDB keyword arguments, one entry per setting
+    :param k: number of neighbors
+    :return: DataFrame with one row per setting
+    """
+    import pandas as pd
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    report_list = []
+    exact_ids = None
+    for index_args in [{"index_type": "flat"}] + list(index_args_list):
+        vector_db = VectorDB(vectors.shape[1], **index_args)
+        time_start = time.perf_counter()
+        vector_db.add_vectors(vectors)
+        build_seconds = time.perf_counter() - time_start
+        time_start = time.perf_counter()
+        _, found_ids = vector_db._search(queries, k)
+        search_seconds = time.perf_counter() - time_start
+        if exact_ids is None:
+            exact_ids = found_ids
+        n_match = sum(
+            len(np.intersect1d(found_ids[i][found_ids[i] >= 0], exact_ids[i]))
+            for i in range(len(queries))
+        )
+        report_dict = dict(index_args)
+        report_dict.update(
+            {
+                "recall_at_k": n_match / float(exact_ids.size),
+                "build_seconds": build_seconds,
+                "latency_ms": 1000 * search_seconds / len(queries),
+            }
+        )
+        report_dict.update(vector_db.get_memory_usage())
+        report_dict.update(
+            {
+                "bytes_per_vector": (
+                    report_dict["index_bytes"] + report_dict["vector_bytes"]
+                )
+                / len(vectors)
+            }
+        )
+        report_list.append(report_dict)
+    return pd.DataFrame(report_list)
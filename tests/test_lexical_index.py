@@ -0,0 +1,29 @@
+from src.lexical_index import BM25Index
+
+
+def get_index() -> BM25Index:
+    bm25_index = BM25Index()
+    bm25_index.add_documents(
+        ["0_0", "0_1", "0_2"],
+        [
+            "the sombrero galaxy is catalogued as ngc 4594.",
+            "ngc 1300 is a barred spiral.",
+            "is it a galaxy?",
+        ],
+    )
+    return bm25_index
+
+
+def test_search_matches_last_word_of_sentence():
+    bm25_index = get_index()
+    assert bm25_index.search("ngc 4594", k=1)[0] == ["0_0"]
+    assert bm25_index.search("4594", k=3)[0] == ["0_0"]
+    assert bm25_index.search("spiral", k=3)[0] == ["0_1"]
+    assert sorted(bm25_index.search("galaxy", k=3)[0]) == ["0_0", "0_2"]
+
+
+def test_search_strips_query_punctuation():
+    bm25_index = get_index()
+    assert bm25_index.search("spiral?", k=3)[0] == ["0_1"]
+    assert bm25_index.search("4594.", k=3)[0] == ["0_0"]
+    assert bm25_index.search(". ?", k=3)[0] == []
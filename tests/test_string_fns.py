@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from src.misc.bench_fns import make_synthetic_text
+from src.misc.file_fns import read_yaml
+from src.misc.string_fns import StringCleaner, clean_string
+
+CHAR_CONFIG_FILEPATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "ref",
+    "char_replace.yml",
+)
+EDGE_SENTENCES = [
+    "",
+    "   ",
+    "Hello, World!",
+    "line one -\nline two\nline three",
+    "see (figure 3)and(table 4)",
+    "tabs\tand  double   spaces",
+    "Ünïcödé — dashes – and “quotes”",
+    "e.g. version 2.0? maybe.",
+    "a,b,c,,,d",
+    "(((nested)))",
+]
+
+
+def clean_per_word(sentence_raw: str, replace_dict: dict) -> str:
+    # pipeline _clean_and_label_sentences ran before StringCleaner #
+    word_list = [
+        s.lower().strip() for s in sentence_raw.split(" ") if len(s.strip()) > 0
+    ]
+    return " ".join([clean_string(s, replace_dict) for s in word_list])
+
+
+def get_sentences(n_sentences: int = 2000) -> list:
+    return EDGE_SENTENCES + make_synthetic_text(n_sentences, np.random.default_rng(0))
+
+
+def test_clean_matches_clean_string():
+    replace_dict = read_yaml(CHAR_CONFIG_FILEPATH)["replace"]
+    string_cleaner = StringCleaner(replace_dict)
+    for sentence in get_sentences():
+        assert string_cleaner.clean(sentence) == clean_string(sentence, replace_dict)
+
+
+def test_clean_sentence_matches_per_word_pipeline():
+    replace_dict = read_yaml(CHAR_CONFIG_FILEPATH)["replace"]
+    string_cleaner = StringCleaner(replace_dict)
+    # run twice so the second pass reads every word from the cache #
+    for _ in range(2):
+        for sentence in get_sentences():
+            assert string_cleaner.clean_sentence(sentence) == clean_per_word(
+                sentence, replace_dict
+            )